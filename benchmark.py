@@ -0,0 +1,545 @@
+def _best_time(function, *args, repeat: int = 3) -> float:
+    """
+    measure the fastest of several runs of a function
+
+    :param function: the function
+    :param args: arguments for the function
+    :param repeat: number of runs
+    :return: the time in seconds
+    """
+    from time import perf_counter
+    r = None
+    for _ in range(repeat):
+        t = perf_counter()
+        function(*args)
+        t = perf_counter() - t
+        if r is None or t < r:
+            r = t
+    return r
+
+
+def _legacy_symmetric_keys(key: bytes, block: int, number_of_blocks: int) -> bytes:
+    """
+    the key schedule of symmetric_encrypt as it was before the keystream generator, used as a baseline
+    """
+    try:
+        from mmath import bytes_xor, int_to_bytes
+        from mhash import any_hash
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import bytes_xor, int_to_bytes
+        from mmL.mhash import any_hash
+    key = b'\xc2\xed\x83\xd7' + key + b'\xde\xb2\xae\xbb'
+    first_key = any_hash(key, block, 17)
+    last_key = any_hash(bytes_xor(any_hash(b'\x12\xb0\xa6\x0b' + key, block, 3), first_key), block, 7)
+    keys = []
+    for i in range(number_of_blocks):
+        last_key = any_hash(bytes_xor(last_key, first_key) + int_to_bytes(i ** 2 + 1), block, 7)
+        keys.append(last_key)
+    return b''.join(keys)
+
+
+def _legacy_symmetric_encrypt(data: bytes, key: bytes, block_size: int = 4) -> bytes:
+    """
+    symmetric_encrypt as it was before the table-driven engine (byte by byte), used as a baseline
+    """
+    try:
+        from mencryption import _SYMMETRIC_BOX, generate_symmetric_key
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mencryption import _SYMMETRIC_BOX, generate_symmetric_key
+    box = list(_SYMMETRIC_BOX)
+    block = block_size ** 2
+    data = len(data).to_bytes(8, 'big') + data
+    while len(data) % block != 0:
+        data += generate_symmetric_key(1)
+    blocks = [data[i:i + block] for i in range(0, len(data), block)]
+    keys = _legacy_symmetric_keys(key, block, len(blocks))
+    cipher = bytes([block_size])
+    for i in range(len(blocks)):
+        b = [0 for _ in range(block)]
+        for j in range(block):
+            b[(j * (block_size + 1) + ((block_size + 5) * 7 + 11)) % block] = blocks[i][j]
+        c = []
+        for j in range(block):
+            c.append(keys[i * block + j] ^ box[b[j]])
+        cipher += bytes(c)
+    return cipher
+
+
+def _legacy_symmetric_decrypt(cipher: bytes, key: bytes) -> bytes:
+    """
+    symmetric_decrypt as it was before the table-driven engine (byte by byte), used as a baseline
+    """
+    try:
+        from mencryption import _SYMMETRIC_I_BOX
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mencryption import _SYMMETRIC_I_BOX
+    i_box = list(_SYMMETRIC_I_BOX)
+    block_size = cipher[0]
+    block = block_size ** 2
+    cipher = cipher[1:]
+    blocks = [cipher[i:i + block] for i in range(0, len(cipher), block)]
+    keys = _legacy_symmetric_keys(key, block, len(blocks))
+    data = b''
+    for i in range(len(blocks)):
+        b = []
+        for j in range(block):
+            b.append(i_box[keys[i * block + j] ^ blocks[i][j]])
+        c = []
+        for j in range(block):
+            c.append((j * (block_size + 1) + ((block_size + 5) * 7 + 11)) % block)
+        d = [0 for _ in range(block)]
+        for j in range(block):
+            d[c.index(j)] = b[j]
+        data += bytes(d)
+    size = int.from_bytes(data[0:8], 'big')
+    return data[8:][:size]
+
+
+def symmetric(size: int = 262144, block_size: int = 8) -> dict:
+    """
+    compare the throughput (MB/s) of symmetric_encrypt and symmetric_decrypt with the byte by byte baseline
+
+    :param size: number of bytes to encrypt
+    :param block_size: square root of the size of blocks
+    :return: {'encrypt': (before, after), 'decrypt': (before, after)}
+    """
+    from os import urandom
+    try:
+        from mencryption import symmetric_encrypt, symmetric_decrypt
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mencryption import symmetric_encrypt, symmetric_decrypt
+    data = urandom(size)
+    key = urandom(32)
+    cipher = symmetric_encrypt(data, key, block_size)
+    mb = size / 1000000
+    return {'encrypt': (mb / _best_time(_legacy_symmetric_encrypt, data, key, block_size),
+                        mb / _best_time(symmetric_encrypt, data, key, block_size)),
+            'decrypt': (mb / _best_time(_legacy_symmetric_decrypt, cipher, key),
+                        mb / _best_time(symmetric_decrypt, cipher, key))}
+
+
+def symmetric_keystream(size: int = 262144, block_size: int = 8) -> dict:
+    """
+    compare the throughput (MB/s) of the key schedule of symmetric_encrypt with the any_hash based baseline
+
+    :param size: number of bytes of keys
+    :param block_size: square root of the size of blocks
+    :return: {'keystream': (before, after)}
+    """
+    from os import urandom
+    try:
+        from mencryption import _symmetric_keys
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mencryption import _symmetric_keys
+    key = urandom(32)
+    block = block_size ** 2
+    mb = size / 1000000
+    return {'keystream': (mb / _best_time(_legacy_symmetric_keys, key, block, size // block),
+                          mb / _best_time(_symmetric_keys, key, block_size, size // block))}
+
+
+def symmetric_key_setup(block_size: int = 8) -> dict:
+    """
+    compare how often per second a short message (one block) can be encrypted with the same key,
+    before the keystream generator, without and with the cached key setup
+
+    :param block_size: square root of the size of blocks
+    :return: {'one block': (before, uncached, cached)}
+    """
+    from os import urandom
+    try:
+        from mencryption import _symmetric_keys, _SYMMETRIC_KEY_CACHE
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mencryption import _symmetric_keys, _SYMMETRIC_KEY_CACHE
+    key = urandom(32)
+    block = block_size ** 2
+
+    def uncached():
+        _SYMMETRIC_KEY_CACHE.clear()
+        _symmetric_keys(key, block_size, 1)
+
+    return {'one block': (1 / _best_time(_legacy_symmetric_keys, key, block, 1), 1 / _best_time(uncached),
+                          1 / _best_time(_symmetric_keys, key, block_size, 1))}
+
+
+def symmetric_parallel(size: int = 8388608, workers: int = None) -> dict:
+    """
+    compare the throughput (MB/s) of symmetric_encrypt_stream with one and several processes
+
+    :param size: number of bytes to encrypt
+    :param workers: number of processes (None = number of cpus)
+    :return: {'encrypt': (1 process, workers processes), 'decrypt': (1 process, workers processes)}
+    """
+    from os import urandom, cpu_count
+    try:
+        from mencryption import symmetric_encrypt_stream, symmetric_decrypt_stream
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mencryption import symmetric_encrypt_stream, symmetric_decrypt_stream
+    if workers is None:
+        workers = max(2, cpu_count() or 1)
+    data = urandom(size)
+    key = urandom(32)
+    cipher = b''.join(symmetric_encrypt_stream(data, None, key, 8))
+    mb = size / 1000000
+
+    def encrypt(w):
+        for _ in symmetric_encrypt_stream(data, None, key, 8, workers=w):
+            pass
+
+    def decrypt(w):
+        for _ in symmetric_decrypt_stream(cipher, None, key, workers=w):
+            pass
+
+    return {'encrypt': (mb / _best_time(encrypt, None, repeat=1), mb / _best_time(encrypt, workers, repeat=1)),
+            'decrypt': (mb / _best_time(decrypt, None, repeat=1), mb / _best_time(decrypt, workers, repeat=1))}
+
+
+def _legacy_miller_prime(n: int, iterations: int = 48) -> bool:
+    """
+    miller_prime as it was before the tiered primality engine (48 random rounds), used as a baseline
+    """
+    try:
+        from mrandom import randint
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mrandom import randint
+    if n < 2:
+        return False
+    if n in [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47]:
+        return True
+    for i in [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47]:
+        if n % i == 0:
+            return False
+    r = 0
+    s = n - 1
+    while s % 2 == 0:
+        r += 1
+        s //= 2
+    for i in range(iterations):
+        a = randint(2, n - 1)
+        x = pow(a, s, n)
+        if x == 1 or x == n - 1:
+            continue
+        for j in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _legacy_random_prime(bits: int) -> int:
+    """
+    random_prime as it was before the sieve (a fresh random number per guess), used as a baseline
+    """
+    try:
+        from mrandom import rand_bits
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mrandom import rand_bits
+    while True:
+        x = int(rand_bits(bits), 2)
+        if _legacy_miller_prime(x):
+            return x
+
+
+def primes(bits: tuple = (1024, 2048, 4096), repeat: int = 5) -> dict:
+    """
+    compare the average time (seconds) random_prime needs for one prime with the baseline without sieve
+
+    :param bits: the lengths of the primes
+    :param repeat: number of primes per length
+    :return: {'<bits> bits': (before, after)}
+    """
+    from time import perf_counter
+    try:
+        from mrandom import random_prime
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mrandom import random_prime
+    r = {}
+    for i in bits:
+        times = []
+        for function in (_legacy_random_prime, random_prime):
+            t = perf_counter()
+            for _ in range(repeat):
+                function(i)
+            times.append((perf_counter() - t) / repeat)
+        r[str(i) + ' bits'] = tuple(times)
+    return r
+
+
+def primality(repeat: int = 200) -> dict:
+    """
+    compare how many primes per second miller_prime can confirm with the 48 random rounds of the baseline
+
+    :param repeat: number of tests per prime
+    :return: {'<bits> bits': (before, after)}
+    """
+    try:
+        from mmath import miller_prime
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import miller_prime
+    r = {}
+    for bits, n in ((61, pow(2, 61) - 1), (127, pow(2, 127) - 1), (521, pow(2, 521) - 1)):
+        times = []
+        for function in (_legacy_miller_prime, miller_prime):
+
+            def test():
+                for _ in range(repeat):
+                    function(n)
+
+            times.append(repeat / _best_time(test, repeat=1))
+        r[str(bits) + ' bits'] = tuple(times)
+    return r
+
+
+def _legacy_sqrt_n(n: int) -> int:
+    """
+    sqrt_n as it was before the integer-root engine (linear search), used as a baseline
+    """
+    if n == 0:
+        return 0
+    if n == 1:
+        return 1
+    for i in range(n):
+        if pow(i, 2) > n:
+            return i - 1
+
+
+def _legacy_sqrt_q(x, y) -> (int, int):
+    """
+    sqrt_q as it was before the integer-root engine (babylonian method with fractions), used as a baseline
+    """
+    try:
+        from mmath import gcd
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import gcd
+    a, b = 1, 1
+    c, d = x, y
+    while True:
+        a = a * d + c * b
+        b = b * d * 2
+        c = b * x
+        d = a * y
+        if abs(a / b - c / d) < 0.000244140625:
+            z = gcd(c, d)
+            return c // z, d // z
+
+
+def roots(repeat: int = 1000) -> dict:
+    """
+    compare how often per second sqrt_n and sqrt_q can be called before and after the integer-root engine
+
+    :param repeat: number of calls per measurement
+    :return: {'sqrt_n(<n>)': (before, after), 'sqrt_q(<x>/<y>)': (before, after)}
+    """
+    try:
+        from mmath import sqrt_n, sqrt_q
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import sqrt_n, sqrt_q
+    r = {}
+    for n, legacy_repeat in ((10000, repeat), (100000000, 1)):
+
+        def legacy():
+            for _ in range(legacy_repeat):
+                _legacy_sqrt_n(n)
+
+        def new():
+            for _ in range(repeat):
+                sqrt_n(n)
+
+        r['sqrt_n(' + str(n) + ')'] = (legacy_repeat / _best_time(legacy, repeat=1), repeat / _best_time(new))
+    for x, y in ((2, 1), (12345, 678)):
+
+        def legacy():
+            for _ in range(repeat):
+                _legacy_sqrt_q(x, y)
+
+        def new():
+            for _ in range(repeat):
+                sqrt_q(x, y)
+
+        r['sqrt_q(' + str(x) + '/' + str(y) + ')'] = (repeat / _best_time(legacy), repeat / _best_time(new))
+    return r
+
+
+def xor(sizes: tuple = (64, 4096, 1048576)) -> dict:
+    """
+    compare the throughput (MB/s) of bytes_xor with the per-byte generator of the baseline
+
+    :param sizes: lengths of the bytes objects
+    :return: {'<size> bytes': (before, after)}
+    """
+    from os import urandom
+    try:
+        from mmath import bytes_xor
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import bytes_xor
+    r = {}
+    for size in sizes:
+        a = urandom(size)
+        b = urandom(size)
+        number = max(1, 1048576 // size)
+
+        def legacy():
+            for _ in range(number):
+                bytes(x ^ y for x, y in zip(a, b))
+
+        def new():
+            for _ in range(number):
+                bytes_xor(a, b)
+
+        mb = size * number / 1000000
+        r[str(size) + ' bytes'] = (mb / _best_time(legacy), mb / _best_time(new))
+    return r
+
+
+def _legacy_gcd(a: int, b: int) -> int:
+    """
+    gcd as it was before the iterative engine (recursive), used as a baseline
+    """
+    if b == 0:
+        return a
+    return _legacy_gcd(b, a % b)
+
+
+def rationals(terms: int = 1000) -> dict:
+    """
+    compare the time (seconds) of a chained rational computation (the harmonic sum) with the baseline,
+    which reduced the full fraction with the recursive gcd after every operation like Q did
+
+    :param terms: number of terms of the sum
+    :return: {'harmonic sum': (before, Q, Rational)}
+    """
+    try:
+        from mmath import Q, Rational
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import Q, Rational
+
+    def legacy():
+        n, d = 0, 1
+        for i in range(1, terms):
+            n, d = n * i + d, d * i
+            g = _legacy_gcd(d, n)
+            n //= g
+            d //= g
+
+    def q():
+        x = Q(0)
+        for i in range(1, terms):
+            x.add_fraction(1, i)
+
+    def rational():
+        x = Rational(0)
+        for i in range(1, terms):
+            x = x + Rational(1, i)
+
+    return {'harmonic sum': (_best_time(legacy), _best_time(q), _best_time(rational))}
+
+
+def random_bytes(number: int = 100000) -> dict:
+    """
+    compare how often per second rand_bytes (and randint) can be called with one os.urandom call per request,
+    with the buffered pool and with a seeded DeterministicRandom
+
+    :param number: number of calls per measurement
+    :return: {'rand_bytes(<n>)': (urandom, pool, deterministic), 'randint(0, 1000000)': (urandom, pool, deterministic)}
+    """
+    try:
+        from mrandom import rand_bytes, randint, set_random_pool, RandomPool, DeterministicRandom
+        import mrandom
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mrandom import rand_bytes, randint, set_random_pool, RandomPool, DeterministicRandom
+        import mmL.mrandom as mrandom
+    pool = mrandom._RANDOM_POOL
+    r = {}
+    try:
+        for name, function in (('rand_bytes(1)', lambda: rand_bytes(1)), ('rand_bytes(16)', lambda: rand_bytes(16)),
+                               ('rand_bytes(64)', lambda: rand_bytes(64)),
+                               ('randint(0, 1000000)', lambda: randint(0, 1000000))):
+
+            def test():
+                for _ in range(number):
+                    function()
+
+            times = []
+            for i in (None, RandomPool(), DeterministicRandom(0)):
+                set_random_pool(i)
+                times.append(number / _best_time(test))
+            r[name] = tuple(times)
+    finally:
+        set_random_pool(pool)
+    return r
+
+
+def integers(number: int = 50000) -> dict:
+    """
+    compare how often per second randint can be called with the fraction based baseline
+
+    :param number: number of calls per measurement
+    :return: {'randint(0, <n>)': (before, after)}
+    """
+    try:
+        from mrandom import randint, rand_below_fraction
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mrandom import randint, rand_below_fraction
+    r = {}
+    for n in (6, 1000000, pow(2, 1024)):
+
+        def legacy():
+            for _ in range(number):
+                x, y = rand_below_fraction(n, 1, True)
+                x // y
+
+        def new():
+            for _ in range(number):
+                randint(0, n)
+
+        r['randint(0, ' + (str(n) if n < pow(2, 64) else '2^1024') + ')'] = \
+            (number / _best_time(legacy), number / _best_time(new))
+    return r
+
+
+def batches(size: int = 1000000) -> dict:
+    """
+    compare how many random values per second are generated one by one and in batches
+
+    :param size: number of values per measurement
+    :return: {'<function>': (single, array.array, numpy)}
+    """
+    try:
+        from mrandom import randint, rand, rand_bits, randints, rands, rand_bits_array
+        from mmath import _numpy
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mrandom import randint, rand, rand_bits, randints, rands, rand_bits_array
+        from mmL.mmath import _numpy
+    r = {}
+    tests = {'randints(0, 1000000)': (lambda: [randint(0, 1000000) for _ in range(size)],
+                                      lambda numpy: randints(0, 1000000, size, numpy)),
+             'rands': (lambda: [rand() for _ in range(size)], lambda numpy: rands(size, numpy)),
+             'rand_bits_array': (lambda: rand_bits(size), lambda numpy: rand_bits_array(size, numpy))}
+    for i in tests:
+        single, batch = tests[i]
+        r[i] = (size / _best_time(single), size / _best_time(batch, False),
+                size / _best_time(batch, True) if _numpy() else 0.0)
+    return r
+
+
+def _print_results(name: str, results: dict, unit: str) -> None:
+    print(name)
+    for i in results:
+        print('  ' + i + ': ' + ' -> '.join(format(j, '.3f') for j in results[i]) + ' ' + unit)
+
+
+if __name__ == '__main__':
+    _print_results('symmetric (before -> after)', symmetric(), 'MB/s')
+    _print_results('symmetric keystream (before -> after)', symmetric_keystream(), 'MB/s')
+    _print_results('symmetric key setup (before -> uncached -> cached)', symmetric_key_setup(), 'calls/s')
+    _print_results('symmetric stream (1 process -> all cpus)', symmetric_parallel(), 'MB/s')
+    _print_results('random_prime (before -> after)', primes(), 's')
+    _print_results('miller_prime on a prime (before -> after)', primality(), 'calls/s')
+    _print_results('integer roots (before -> after)', roots(), 'calls/s')
+    _print_results('bytes_xor (before -> after)', xor(), 'MB/s')
+    _print_results('rationals (before -> Q -> Rational)', rationals(), 's')
+    _print_results('random bytes (os.urandom -> pool -> deterministic)', random_bytes(), 'calls/s')
+    _print_results('random integers (before -> after)', integers(), 'calls/s')
+    _print_results('random batches (single -> array -> numpy)', batches(), 'values/s')
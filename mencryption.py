@@ -1,39 +1,311 @@
+_SYMMETRIC_BOX = bytes([99, 124, 119, 123, 242, 107, 111, 197, 48, 1, 103, 43, 254, 215, 171, 118, 202, 130, 201, 125,
+                        250, 89, 71, 240, 173, 212, 162, 175, 156, 164, 114, 192, 183, 253, 147, 38, 54, 63, 247, 204,
+                        52, 165, 229, 241, 113, 216, 49, 21, 4, 199, 35, 195, 24, 150, 5, 154, 7, 18, 128, 226, 235, 39,
+                        178, 117, 9, 131, 44, 26, 27, 110, 90, 160, 82, 59, 214, 179, 41, 227, 47, 132, 83, 209, 0, 237,
+                        32, 252, 177, 91, 106, 203, 190, 57, 74, 76, 88, 207, 208, 239, 170, 251, 67, 77, 51, 133, 69,
+                        249, 2, 127, 80, 60, 159, 168, 81, 163, 64, 143, 146, 157, 56, 245, 188, 182, 218, 33, 16, 255,
+                        243, 210, 205, 12, 19, 236, 95, 151, 68, 23, 196, 167, 126, 61, 100, 93, 25, 115, 96, 129, 79,
+                        220, 34, 42, 144, 136, 70, 238, 184, 20, 222, 94, 11, 219, 224, 50, 58, 10, 73, 6, 36, 92, 194,
+                        211, 172, 98, 145, 149, 228, 121, 231, 200, 55, 109, 141, 213, 78, 169, 108, 86, 244, 234, 101,
+                        122, 174, 8, 186, 120, 37, 46, 28, 166, 180, 198, 232, 221, 116, 31, 75, 189, 139, 138, 112, 62,
+                        181, 102, 72, 3, 246, 14, 97, 53, 87, 185, 134, 193, 29, 158, 225, 248, 152, 17, 105, 217, 142,
+                        148, 155, 30, 135, 233, 206, 85, 40, 223, 140, 161, 137, 13, 191, 230, 66, 104, 65, 153, 45, 15,
+                        176, 84, 187, 22])
 
+_SYMMETRIC_I_BOX = bytes([82, 9, 106, 213, 48, 54, 165, 56, 191, 64, 163, 158, 129, 243, 215, 251, 124, 227, 57, 130,
+                          155, 47, 255, 135, 52, 142, 67, 68, 196, 222, 233, 203, 84, 123, 148, 50, 166, 194, 35, 61,
+                          238, 76, 149, 11, 66, 250, 195, 78, 8, 46, 161, 102, 40, 217, 36, 178, 118, 91, 162, 73, 109,
+                          139, 209, 37, 114, 248, 246, 100, 134, 104, 152, 22, 212, 164, 92, 204, 93, 101, 182, 146,
+                          108, 112, 72, 80, 253, 237, 185, 218, 94, 21, 70, 87, 167, 141, 157, 132, 144, 216, 171, 0,
+                          140, 188, 211, 10, 247, 228, 88, 5, 184, 179, 69, 6, 208, 44, 30, 143, 202, 63, 15, 2, 193,
+                          175, 189, 3, 1, 19, 138, 107, 58, 145, 17, 65, 79, 103, 220, 234, 151, 242, 207, 206, 240,
+                          180, 230, 115, 150, 172, 116, 34, 231, 173, 53, 133, 226, 249, 55, 232, 28, 117, 223, 110, 71,
+                          241, 26, 113, 29, 41, 197, 137, 111, 183, 98, 14, 170, 24, 190, 27, 252, 86, 62, 75, 198, 210,
+                          121, 32, 154, 219, 192, 254, 120, 205, 90, 244, 31, 221, 168, 51, 136, 7, 199, 49, 177, 18,
+                          16, 89, 39, 128, 236, 95, 96, 81, 127, 169, 25, 181, 74, 13, 45, 229, 122, 159, 147, 201, 156,
+                          239, 160, 224, 59, 77, 174, 42, 245, 176, 200, 235, 187, 60, 131, 83, 153, 97, 23, 43, 4, 126,
+                          186, 119, 214, 38, 225, 105, 20, 99, 85, 33, 12, 125])
 
-def generate_rsa_keys(length: int = 2048, exponent: int = None) -> [int, int, int]:
+_SYMMETRIC_POSITIONS = {}
+
+_SYMMETRIC_KEY_CACHE = {}
+
+SYMMETRIC_KEY_CACHE_SIZE = 32
+
+
+class RSAPrivateKey(int):
+    """
+    A private rsa key which also remembers the factors of n to speed up private operations (CRT)
+    It behaves like the integer d, so it can be used wherever d was used before
+    """
+
+    def __new__(cls, d: int, n: int, p: int, q: int, dp: int = None, dq: int = None, q_inv: int = None):
+        try:
+            from mmath import CRT, mod_inverse
+        except (ImportError, ModuleNotFoundError):
+            from mmL.mmath import CRT, mod_inverse
+        if p * q != n:
+            raise ValueError('p * q has to be equal to n')
+        obj = super().__new__(cls, d)
+        obj.n = n
+        obj.p = p
+        obj.q = q
+        obj.dp = d % (p - 1) if dp is None else dp
+        obj.dq = d % (q - 1) if dq is None else dq
+        obj.q_inv = mod_inverse(q, p) if q_inv is None else q_inv
+        obj.crt = CRT([q, p], [obj.q_inv])
+        return obj
+
+    def __reduce__(self):
+        return self.__class__, (int(self), self.n, self.p, self.q, self.dp, self.dq, self.q_inv)
+
+    def decrypt(self, cipher: int) -> int:
+        """
+        apply the private key using the chinese remainder theorem (about 3-4 times faster than pow(c, d, n))
+
+        :param cipher: the ciphertext (or the data to sign)
+        :return: the plaintext (or the signature)
+        """
+        return self.crt.combine([pow(cipher, self.dq, self.q), pow(cipher, self.dp, self.p)])
+
+    def to_dict(self) -> dict:
+        return {'d': int(self), 'n': self.n, 'p': self.p, 'q': self.q, 'dp': self.dp, 'dq': self.dq,
+                'q_inv': self.q_inv}
+
+    @classmethod
+    def from_dict(cls, x: dict):
+        return cls(x['d'], x['n'], x['p'], x['q'], x.get('dp'), x.get('dq'), x.get('q_inv'))
+
+
+def _random_primes(bits: int, count: int, workers: int = None, rng=None) -> list:
+    """
+    generate several random primes, in parallel if workers is set
+
+    :param bits: number of bits of every prime
+    :param count: number of primes
+    :param workers: number of processes (None: search one after another)
+    :param rng: a DeterministicRandom (see mrandom), None: the default generator
+    :return: the primes
+    """
+    try:
+        from mrandom import random_prime, get_rng, DeterministicRandom
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mrandom import random_prime, get_rng, DeterministicRandom
+    rng = get_rng(rng)
+    if isinstance(rng, DeterministicRandom):
+        # every prime gets its own stream, so the result doesn't depend on the number of workers
+        rngs = [rng.split() for _ in range(count)]
+    else:
+        rngs = [None] * count
+    if workers is None or workers <= 1:
+        return [random_prime(bits, rng=i) for i in rngs]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(min(workers, count)) as executor:
+        return list(executor.map(random_prime, [bits] * count, [65536] * count, rngs))
+
+
+def generate_rsa_keys(length: int = 2048, exponent: int = None, workers: int = None,
+                      pool=None, rng=None) -> [int, int, int]:
     """
     generate keys for the rsa cryptosystem
 
     :param length: the length of the modulo in bits (base 2) (HAS to be a multiple of 2!)
-    :param exponent: Optional: use custom exponent, for example: 65537
-    :return: [e, d, n]: e and n are public, d is a secret
+    :param exponent: Optional: use custom exponent, for example: 65537 (a lot faster than None, which generates a
+                     random prime as exponent)
+    :param workers: search p and q (and e) at the same time in this many processes
+    :param pool: an RSAKeyPool; if it contains a key with the same length and exponent, that key is used instead
+                 (set_rsa_key_pool sets a default pool, False ignores it)
+    :param rng: a DeterministicRandom (see mrandom) for reproducible keys (the pool is ignored then), None: the
+                default generator
+    :return: [e, d, n]: e and n are public, d is a secret (d is an RSAPrivateKey, which can be used like an integer)
     """
     if length % 2 == 1:
         raise ValueError('Length has to be a multiple of 2')
     try:
-        from mrandom import random_prime
+        from mrandom import random_prime, get_rng, DeterministicRandom
+        from mmath import gcd, mod_inverse
     except (ImportError, ModuleNotFoundError):
-        from mmL.mrandom import random_prime
-    p = random_prime(length // 2)
-    q = random_prime(length // 2)
+        from mmL.mrandom import random_prime, get_rng, DeterministicRandom
+        from mmL.mmath import gcd, mod_inverse
+    rng = get_rng(rng)
+    if isinstance(rng, DeterministicRandom):
+        pool = False
+    elif pool is None:
+        pool = _RSA_KEY_POOL
+    if isinstance(pool, RSAKeyPool) and pool.length == length and pool.exponent == exponent:
+        r = pool.get()
+        if r is not None:
+            return r
+    x = _random_primes(length // 2, 2 if exponent is not None else 3, workers, rng)
+    p, q = x[0], x[1]
     while q == p:
-        q = random_prime(length // 2)
+        q = random_prime(length // 2, rng=rng)
     n = p * q
     phi_n = (p - 1) * (q - 1)
     if exponent is None:
-        e = random_prime(length // 2)
-        while phi_n % e == 0 or n % e == 0:
-            e = random_prime(length // 2)
+        e = x[2]
+        while gcd(e, phi_n) != 1 or n % e == 0:
+            e = random_prime(length // 2, rng=rng)
     else:
-        if phi_n % exponent == 0 or n % exponent == 0:
+        if gcd(exponent, phi_n) != 1 or n % exponent == 0:
             raise ValueError('It is not possible to use e=' + str(exponent) + ' as an exponent for p=' + str(p) +
                              ' and q=' + str(q) + ' .')
         else:
             e = exponent
-    d = pow(e, -1, phi_n)
+    d = RSAPrivateKey(mod_inverse(e, phi_n), n, p, q)
     return [e, d, n]
 
 
+class RSAKeyPool:
+    """
+    A file with pre-generated rsa keys, so that generate_rsa_keys can return immediately
+    """
+
+    def __init__(self, path: str, length: int = 2048, exponent: int = 65537, size: int = 4,
+                 workers: int = None) -> None:
+        """
+        :param path: the json file which stores the keys (it is created readable only by you)
+        :param length: the length of the modulo in bits
+        :param exponent: the exponent (None = random prime)
+        :param size: the number of keys fill() generates
+        :param workers: number of processes used to generate keys
+        """
+        from threading import Lock
+        self.path = path
+        self.length = length
+        self.exponent = exponent
+        self.size = size
+        self.workers = workers
+        self._lock = Lock()
+        self._thread = None
+
+    def _locked(self, function):
+        # the lock file also protects the pool from other processes
+        from os import open as os_open, close, remove, O_CREAT, O_EXCL, O_WRONLY
+        from os.path import getmtime
+        from time import time, sleep
+        with self._lock:
+            removed = False
+            while True:
+                try:
+                    f = os_open(self.path + '.lock', O_CREAT | O_EXCL | O_WRONLY)
+                    break
+                except FileExistsError:
+                    pass
+                # a lock file older than 30 seconds was left behind by a process which crashed
+                try:
+                    if not removed and time() - getmtime(self.path + '.lock') > 30:
+                        removed = True
+                        remove(self.path + '.lock')
+                        continue
+                except FileNotFoundError:
+                    continue
+                sleep(0.01)
+            try:
+                return function()
+            finally:
+                close(f)
+                remove(self.path + '.lock')
+
+    def _load(self) -> list:
+        # the file may also contain keys of pools with another length or exponent, which have to be kept
+        from json import load
+        from os.path import exists
+        if not exists(self.path):
+            return []
+        with open(self.path, 'r') as f:
+            return load(f)
+
+    def _matches(self, key: dict) -> bool:
+        return key['length'] == self.length and key['exponent'] == self.exponent
+
+    def _save(self, keys: list) -> None:
+        # the file contains private keys, so only the owner may read it (also if a .tmp file was left behind)
+        from json import dump
+        from os import open as os_open, replace, O_CREAT, O_WRONLY, O_TRUNC
+        f = os_open(self.path + '.tmp', O_CREAT | O_WRONLY | O_TRUNC, 0o600)
+        try:
+            from os import fchmod
+            fchmod(f, 0o600)
+        except ImportError:
+            pass
+        with open(f, 'w') as f:
+            dump(keys, f, indent=4)
+        replace(self.path + '.tmp', self.path)
+
+    def __len__(self) -> int:
+        return len([i for i in self._locked(self._load) if self._matches(i)])
+
+    def get(self):
+        """
+        take a key out of the pool
+
+        :return: [e, d, n] or None if the pool is empty
+        """
+        def pop():
+            keys = self._load()
+            for i in range(len(keys) - 1, -1, -1):
+                if self._matches(keys[i]):
+                    x = keys.pop(i)
+                    self._save(keys)
+                    return x
+            return None
+        x = self._locked(pop)
+        if x is None:
+            return None
+        return [x['e'], RSAPrivateKey.from_dict(x), x['n']]
+
+    def add(self, e: int, d: int, n: int) -> None:
+        """
+        put a key into the pool
+
+        :param e: public key (e)
+        :param d: private key (an RSAPrivateKey, the factors of n are required)
+        :param n: public key (n)
+        """
+        def append():
+            keys = self._load()
+            keys.append({'length': self.length, 'exponent': self.exponent, 'e': e, **d.to_dict()})
+            self._save(keys)
+        self._locked(append)
+
+    def fill(self) -> None:
+        """
+        generate keys until the pool contains size keys
+        """
+        while len(self) < self.size:
+            try:
+                e, d, n = generate_rsa_keys(self.length, self.exponent, self.workers, False)
+            except ValueError:
+                continue
+            self.add(e, d, n)
+
+    def fill_in_background(self):
+        """
+        fill the pool in a background thread (the keys are generated in worker processes if workers is set)
+
+        :return: the thread
+        """
+        from threading import Thread
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = Thread(target=self.fill, daemon=True)
+            self._thread.start()
+        return self._thread
+
+
+_RSA_KEY_POOL = None
+
+
+def set_rsa_key_pool(pool) -> None:
+    """
+    set the pool which generate_rsa_keys uses by default
+
+    :param pool: an RSAKeyPool or None
+    """
+    global _RSA_KEY_POOL
+    _RSA_KEY_POOL = pool
+
+
 def rsa_encrypt(data: int, e: int, n: int) -> int:
     """
     encrypt data with the rsa cryptosystem (rsa_fernet_encrypt is more secure and supports more data)
@@ -53,10 +325,12 @@ def rsa_decrypt(cipher: int, d: int, n: int) -> int:
     decrypt ciphers with the rsa cryptosystem
 
     :param cipher: the ciphertext
-    :param d: your private key
+    :param d: your private key (an RSAPrivateKey is a lot faster)
     :param n: your public key (n)
     :return: the plaintext
     """
+    if isinstance(d, RSAPrivateKey) and d.n == n:
+        return d.decrypt(cipher)
     return pow(cipher, d, n)
 
 
@@ -114,7 +388,114 @@ def fernet_decrypt(cipher: bytes, key: bytes) -> bytes:
     return obj.decrypt(cipher)
 
 
-def rsa_fernet_encrypt(data: bytes, e: int, n: int, oe: int, od: int, on: int) -> bytes:
+def rsa_fingerprint(e: int, n: int) -> bytes:
+    """
+    get a short fingerprint of a public rsa key (cipher version 3 uses it to identify the sender)
+
+    :param e: public key (e)
+    :param n: public key (n)
+    :return: the fingerprint (16 bytes)
+    """
+    try:
+        from mmath import int_to_bytes
+        from mhash import sha256
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import int_to_bytes
+        from mmL.mhash import sha256
+    x = int_to_bytes(e)
+    y = int_to_bytes(n)
+    return sha256(len(x).to_bytes(2, 'big') + x + len(y).to_bytes(2, 'big') + y)[0:16]
+
+
+def _pack_envelope(flags: int, enc_key: int, body: bytes, signature: int, oe: int, on: int,
+                   include_key: bool) -> bytes:
+    """
+    build a cipher of version 3:
+    0x03 + flags + key length (2 bytes) + encrypted key + signature length (2 bytes) + signature +
+    body length (4 bytes) + body + sender
+    the sender is either the fingerprint of the public key (16 bytes) or (flag 1) e and n, each with a 2 byte length
+    flag 2 marks a body encrypted with symmetric_encrypt instead of fernet
+
+    :return: the cipher
+    """
+    try:
+        from mmath import int_to_bytes
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import int_to_bytes
+    enc_key = int_to_bytes(enc_key)
+    signature = int_to_bytes(signature)
+    r = [b'\x03', bytes([flags | int(include_key)]), len(enc_key).to_bytes(2, 'big'), enc_key,
+         len(signature).to_bytes(2, 'big'), signature, len(body).to_bytes(4, 'big'), body]
+    if include_key:
+        for i in (int_to_bytes(oe), int_to_bytes(on)):
+            r += [len(i).to_bytes(2, 'big'), i]
+    else:
+        r.append(rsa_fingerprint(oe, on))
+    return b''.join(r)
+
+
+def _read_envelope(cipher: bytes, symmetric: bool, keys: dict = None) -> [int, int, bytes, int, int, int]:
+    """
+    split a cipher of rsa_fernet_encrypt (symmetric=False) or rsa_extended_encrypt (symmetric=True) into its parts
+
+    :param cipher: the ciphertext (version 1, 2 or 3)
+    :param symmetric: the body has to be encrypted with symmetric_encrypt
+    :param keys: known public keys of senders {fingerprint: (e, n)} (required for version 3 without included key)
+    :return: [version; encrypted key; body; signature; public key (e) of sender; public key (n) of sender]
+             (e and n are None if the sender is unknown)
+    """
+    from base64 import urlsafe_b64encode, urlsafe_b64decode
+    try:
+        from mmath import bytes_to_int
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import bytes_to_int
+    if cipher[0:1] == b'\x03':
+        m = memoryview(cipher)
+        if len(m) < 2 or bool(m[1] & 2) != symmetric:
+            raise ValueError('This cipher version is not supported')
+        flags = m[1]
+        parts = []
+        i = 2
+        try:
+            for j in (2, 2, 4):
+                size = int.from_bytes(m[i:i + j], 'big')
+                if i + j + size > len(m):
+                    raise ValueError('cipher is corrupted')
+                parts.append(m[i + j:i + j + size])
+                i += j + size
+            if flags & 1:
+                for j in range(2):
+                    size = int.from_bytes(m[i:i + 2], 'big')
+                    parts.append(int.from_bytes(m[i + 2:i + 2 + size], 'big'))
+                    i += 2 + size
+                oe, on = parts[3], parts[4]
+            else:
+                oe, on = (keys or {}).get(bytes(m[i:i + 16]), (None, None))
+                i += 16
+        except IndexError:
+            raise ValueError('cipher is corrupted')
+        if i != len(m):
+            raise ValueError('cipher is corrupted')
+        if symmetric:
+            body = bytes(parts[2])
+        else:
+            body = urlsafe_b64encode(parts[2])
+        return [3, int.from_bytes(parts[0], 'big'), body, int.from_bytes(parts[1], 'big'), oe, on]
+    c = cipher.split(b'.')
+    if len(c) != 6:
+        raise ValueError('cipher is corrupted')
+    if c[0] != (b'\x02' if symmetric else b'\x01'):
+        raise ValueError('This cipher version is not supported')
+    if symmetric:
+        body = urlsafe_b64decode(c[2])
+    else:
+        body = c[2]
+    return [c[0][0], bytes_to_int(urlsafe_b64decode(c[1])), body, bytes_to_int(urlsafe_b64decode(c[3])),
+            bytes_to_int(urlsafe_b64decode(c[4])), bytes_to_int(urlsafe_b64decode(c[5]))]
+
+
+def rsa_fernet_encrypt(data: bytes, e: int, n: int, oe: int, od: int, on: int, version: int = 1,
+                       include_key: bool = True) -> bytes:
     """
     encrypt data using a mix of fernet encryption and the rsa cryptosystem (recommended asymmetric method)
     protects against several kinds of attacks and supports signatures
@@ -123,8 +504,11 @@ def rsa_fernet_encrypt(data: bytes, e: int, n: int, oe: int, od: int, on: int) -
     :param e: public key (e) of the other person
     :param n: public key (n) of the other person
     :param oe: your public key (e)
-    :param od: your private key
+    :param od: your private key (an RSAPrivateKey is a lot faster)
     :param on: your public key (n)
+    :param version: 1 (text) or 3 (compact binary format)
+    :param include_key: version 3 only: include your public key instead of its fingerprint
+                        (the other person needs to know your key if this is disabled)
     :return: the ciphertext
     """
     from base64 import urlsafe_b64encode, urlsafe_b64decode
@@ -136,97 +520,273 @@ def rsa_fernet_encrypt(data: bytes, e: int, n: int, oe: int, od: int, on: int) -
         from mmL.mhash import sha256
     key = generate_fernet_key()
     cipher = fernet_encrypt(data, key)
-    enc_key = urlsafe_b64encode(int_to_bytes(rsa_encrypt(bytes_to_int(urlsafe_b64decode(key)), e, n)))
-    signature = urlsafe_b64encode(int_to_bytes(rsa_encrypt(bytes_to_int(sha256(data)), od, on)))
-    r = b'\x01.' + enc_key + b'.' + cipher + b'.' + signature + b'.' + \
+    enc_key = rsa_encrypt(bytes_to_int(urlsafe_b64decode(key)), e, n)
+    signature = rsa_decrypt(bytes_to_int(sha256(data)), od, on)
+    if version == 3:
+        return _pack_envelope(0, enc_key, urlsafe_b64decode(cipher), signature, oe, on, include_key)
+    elif version != 1:
+        raise ValueError('This cipher version is not supported')
+    r = b'\x01.' + urlsafe_b64encode(int_to_bytes(enc_key)) + b'.' + cipher + b'.' + \
+        urlsafe_b64encode(int_to_bytes(signature)) + b'.' + \
         urlsafe_b64encode(int_to_bytes(oe)) + b'.' + urlsafe_b64encode(int_to_bytes(on))
     return r
 
 
-def rsa_fernet_decrypt(cipher: bytes, d: int, n: int, disable_checksum: bool = False) -> bytes:
+def rsa_fernet_decrypt(cipher: bytes, d: int, n: int, disable_checksum: bool = False, keys: dict = None) -> bytes:
     """
     decrypt data using a mix of fernet encryption and the rsa cryptosystem
 
     :param cipher: the ciphertext
-    :param d: your private key
-    :param n:your public key (n)
+    :param d: your private key (an RSAPrivateKey is a lot faster)
+    :param n: your public key (n)
     :param disable_checksum: disable signature checks (NOT recommended)
+    :param keys: known public keys {rsa_fingerprint(e, n): (e, n)} (for version 3 ciphers without the sender's key)
     :return: the plaintext
     """
-    from base64 import urlsafe_b64encode, urlsafe_b64decode
+    from base64 import urlsafe_b64encode
     try:
         from mmath import bytes_to_int, int_to_bytes
         from mhash import sha256
     except (ImportError, ModuleNotFoundError):
         from mmL.mmath import bytes_to_int, int_to_bytes
         from mmL.mhash import sha256
-    c = cipher.split(b'.')
-    if len(c) != 6:
-        raise ValueError('cipher is corrupted')
-    if c[0] != b'\x01':
-        raise ValueError('This cipher version is not supported')
-    key = int_to_bytes(rsa_decrypt(bytes_to_int(urlsafe_b64decode(c[1])), d, n))
-    while len(key) < 32:
-        key = b'\x00' + key
-    data = fernet_decrypt(c[2], urlsafe_b64encode(key))
+    version, enc_key, body, signature, oe, on = _read_envelope(cipher, False, keys)
+    key = int_to_bytes(rsa_decrypt(enc_key, d, n), 32)
+    data = fernet_decrypt(body, urlsafe_b64encode(key))
     if disable_checksum:
         return data
+    if on is None:
+        raise ValueError('The sender of this cipher is unknown')
     hashed = sha256(data)
-    oe = bytes_to_int(urlsafe_b64decode(c[4]))
-    on = bytes_to_int(urlsafe_b64decode(c[5]))
-    signature = int_to_bytes(rsa_decrypt(bytes_to_int(urlsafe_b64decode(c[3])), oe, on))
-    if signature != hashed:
+    if rsa_decrypt(signature, oe, on) != bytes_to_int(hashed):
         raise ValueError('Signature is invalid')
     return data
 
 
-def rsa_fernet_signature(cipher: bytes, d: int, n: int) -> [bool, int, int, int]:
+def rsa_fernet_signature(cipher: bytes, d: int, n: int, keys: dict = None) -> [bool, int, int, int]:
     """
-    get information about a cipher
+    get information about a cipher (use rsa_fernet_open if you also need the plaintext)
 
     :param cipher: the ciphertext
-    :param d: your private key
+    :param d: your private key (an RSAPrivateKey is a lot faster)
     :param n: your public key (n)
+    :param keys: known public keys {rsa_fingerprint(e, n): (e, n)} (for version 3 ciphers without the sender's key)
     :return: [has valid signature; public key (e) of sender; public key (n) of sender; version]
     """
-    from base64 import urlsafe_b64encode, urlsafe_b64decode
+    return rsa_fernet_open(cipher, d, n, keys)[1:]
+
+
+def rsa_fernet_open(cipher: bytes, d: int, n: int, keys: dict = None) -> [bytes, bool, int, int, int]:
+    """
+    decrypt a cipher and check its signature at once (faster than rsa_fernet_decrypt and rsa_fernet_signature)
+
+    :param cipher: the ciphertext
+    :param d: your private key (an RSAPrivateKey is a lot faster)
+    :param n: your public key (n)
+    :param keys: known public keys {rsa_fingerprint(e, n): (e, n)} (for version 3 ciphers without the sender's key)
+    :return: [plaintext; has valid signature; public key (e) of sender; public key (n) of sender; version]
+    """
+    from base64 import urlsafe_b64encode
     try:
         from mmath import bytes_to_int, int_to_bytes
         from mhash import sha256
     except (ImportError, ModuleNotFoundError):
         from mmL.mmath import bytes_to_int, int_to_bytes
         from mmL.mhash import sha256
+    version, enc_key, body, signature, oe, on = _read_envelope(cipher, False, keys)
+    if on is None:
+        raise ValueError('The sender of this cipher is unknown')
+    key = int_to_bytes(rsa_decrypt(enc_key, d, n), 32)
+    data = fernet_decrypt(body, urlsafe_b64encode(key))
+    hashed = sha256(data)
+    return [data, rsa_decrypt(signature, oe, on) == bytes_to_int(hashed), oe, on, version]
+
+
+def generate_session(lifetime: int = 3600) -> dict:
+    """
+    generate a new session for session_encrypt and session_decrypt
+    (send it to the other person with rsa_fernet_encrypt once, afterwards only symmetric encryption is needed)
+
+    :param lifetime: number of seconds until the session expires
+    :return: {'id': str, 'key': str, 'expires': int} (can be stored as json)
+    """
+    from base64 import urlsafe_b64encode
+    from time import time
+    try:
+        from mrandom import rand_bytes
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mrandom import rand_bytes
+    return {'id': urlsafe_b64encode(rand_bytes(16)).decode(), 'key': generate_fernet_key().decode(),
+            'expires': int(time()) + lifetime}
+
+
+def get_session_id(cipher: bytes) -> str:
+    """
+    get the id of the session a cipher belongs to
+
+    :param cipher: the ciphertext (created by session_encrypt)
+    :return: the session id
+    """
     c = cipher.split(b'.')
-    if len(c) != 6:
+    if len(c) != 3:
         raise ValueError('cipher is corrupted')
-    if c[0] != b'\x01':
+    if c[0] != b'\x10':
         raise ValueError('This cipher version is not supported')
-    key = int_to_bytes(rsa_decrypt(bytes_to_int(urlsafe_b64decode(c[1])), d, n))
-    while len(key) < 32:
-        key = b'\x00' + key
-    data = fernet_decrypt(c[2], urlsafe_b64encode(key))
-    hashed = sha256(data)
-    oe = bytes_to_int(urlsafe_b64decode(c[4]))
-    on = bytes_to_int(urlsafe_b64decode(c[5]))
-    signature = int_to_bytes(rsa_decrypt(bytes_to_int(urlsafe_b64decode(c[3])), oe, on))
-    if signature == hashed:
-        return [True, oe, on, bytes_to_int(c[0])]
-    else:
-        return [False, oe, on, bytes_to_int(c[0])]
+    return c[1].decode()
 
 
-def generate_symmetric_key(key_size: int = 16) -> bytes:
+def session_encrypt(data: bytes, session: dict) -> bytes:
+    """
+    encrypt data using a session (fernet: AES and HMAC, the session id is authenticated as well)
+
+    :param data: the plaintext
+    :param session: the session (created by generate_session)
+    :return: the ciphertext
+    """
+    from base64 import urlsafe_b64decode
+    from time import time
+    if session['expires'] < time():
+        raise ValueError('Session has expired')
+    cipher = fernet_encrypt(urlsafe_b64decode(session['id']) + data, session['key'].encode())
+    return b'\x10.' + session['id'].encode() + b'.' + cipher
+
+
+def session_decrypt(cipher: bytes, session: dict) -> bytes:
+    """
+    decrypt ciphers created by session_encrypt
+
+    :param cipher: the ciphertext
+    :param session: the session (created by generate_session)
+    :return: the plaintext
+    """
+    from base64 import urlsafe_b64decode
+    from time import time
+    if get_session_id(cipher) != session['id']:
+        raise ValueError('The cipher belongs to another session')
+    if session['expires'] < time():
+        raise ValueError('Session has expired')
+    session_id = urlsafe_b64decode(session['id'])
+    data = fernet_decrypt(cipher.split(b'.')[2], session['key'].encode())
+    if data[0:len(session_id)] != session_id:
+        raise ValueError('The cipher belongs to another session')
+    return data[len(session_id):]
+
+
+def generate_symmetric_key(key_size: int = 16, rng=None) -> bytes:
     """
     generate a random key for symmetric encryption
 
     :param key_size: size in bytes
+    :param rng: a DeterministicRandom (see mrandom), None: the default generator
     :return: a random key
     """
     try:
         from mrandom import rand_bytes
     except (ImportError, ModuleNotFoundError):
         from mmL.mrandom import rand_bytes
-    return rand_bytes(key_size)
+    return rand_bytes(key_size, rng)
+
+
+def _symmetric_positions(block_size: int) -> list:
+    """
+    get the position of every byte of a block after the permutation of symmetric_encrypt
+
+    :param block_size: square root of the size of blocks
+    :return: the positions
+    """
+    if block_size not in _SYMMETRIC_POSITIONS:
+        block = block_size ** 2
+        _SYMMETRIC_POSITIONS[block_size] = [(j * (block_size + 1) + ((block_size + 5) * 7 + 11)) % block
+                                            for j in range(block)]
+    return _SYMMETRIC_POSITIONS[block_size]
+
+
+def _symmetric_hash(obj: bytes, block: int, iterations: int) -> bytes:
+    """
+    the same as any_hash, but faster for blocks of up to 64 bytes
+
+    :param obj: bytes object
+    :param block: length in bytes of the hash
+    :param iterations: number of iterations
+    :return: the hash
+    """
+    from hashlib import sha3_512
+    try:
+        from mhash import any_hash
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mhash import any_hash
+    if block > 64:
+        return any_hash(obj, block, iterations)
+    for _ in range(iterations):
+        obj = sha3_512(obj).digest()
+    return obj[0:block]
+
+
+def _symmetric_key_setup(key: bytes, block: int, cache: bool = True) -> (bytes, bytes):
+    """
+    derive first_key and the initial last_key of the key schedule of symmetric_encrypt
+
+    :param key: the key
+    :param block: the size of blocks
+    :param cache: remember the result for the next SYMMETRIC_KEY_CACHE_SIZE keys
+    :return: (first_key, last_key)
+    """
+    try:
+        from mmath import bytes_xor
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import bytes_xor
+    key = b'\xc2\xed\x83\xd7' + key + b'\xde\xb2\xae\xbb'
+    if cache and (key, block) in _SYMMETRIC_KEY_CACHE:
+        return _SYMMETRIC_KEY_CACHE[(key, block)]
+    first_key = _symmetric_hash(key, block, 17)
+    last_key = _symmetric_hash(bytes_xor(_symmetric_hash(b'\x12\xb0\xa6\x0b' + key, block, 3), first_key), block, 7)
+    if cache and SYMMETRIC_KEY_CACHE_SIZE > 0:
+        while len(_SYMMETRIC_KEY_CACHE) >= SYMMETRIC_KEY_CACHE_SIZE:
+            del _SYMMETRIC_KEY_CACHE[next(iter(_SYMMETRIC_KEY_CACHE))]
+        _SYMMETRIC_KEY_CACHE[(key, block)] = (first_key, last_key)
+    return first_key, last_key
+
+
+def symmetric_keystream(key: bytes, block_size: int, cache: bool = True):
+    """
+    generate the keys of the blocks of symmetric_encrypt and symmetric_decrypt lazily
+    (every key depends on the previous one, so they can only be calculated in order)
+
+    :param key: the key
+    :param block_size: square root of the size of blocks
+    :param cache: reuse the setup of recently used keys
+    :return: a generator of the keys of all blocks (one key per block)
+    """
+    from hashlib import sha3_512
+    block = block_size ** 2
+    first_key, last_key = _symmetric_key_setup(key, block, cache)
+    first_key = int.from_bytes(first_key, 'big')
+    i = 0
+    while True:
+        x = i ** 2 + 1
+        last_key = (int.from_bytes(last_key, 'big') ^ first_key).to_bytes(block, 'big') + \
+            x.to_bytes((x.bit_length() + 7) // 8, 'big')
+        if block > 64:
+            last_key = _symmetric_hash(last_key, block, 7)
+        else:
+            for _ in range(7):
+                last_key = sha3_512(last_key).digest()
+            last_key = last_key[0:block]
+        yield last_key
+        i += 1
+
+
+def _symmetric_keys(key: bytes, block_size: int, number_of_blocks: int) -> bytes:
+    """
+    generate the keys of all blocks for symmetric_encrypt and symmetric_decrypt
+
+    :param key: the key
+    :param block_size: square root of the size of blocks
+    :param number_of_blocks: the number of blocks
+    :return: the keys of all blocks joined together
+    """
+    from itertools import islice
+    return b''.join(islice(symmetric_keystream(key, block_size), number_of_blocks))
 
 
 def symmetric_encrypt(data: bytes, key: bytes, block_size: int = 4) -> bytes:
@@ -238,51 +798,41 @@ def symmetric_encrypt(data: bytes, key: bytes, block_size: int = 4) -> bytes:
     :param block_size: square root of the size of blocks
     :return: a cipher text
     """
-    try:
-        from mmath import bytes_xor, int_to_bytes
-        from mhash import any_hash
-    except (ImportError, ModuleNotFoundError):
-        from mmL.mmath import bytes_xor, int_to_bytes
-        from mmL.mhash import any_hash
-    box = [99, 124, 119, 123, 242, 107, 111, 197, 48, 1, 103, 43, 254, 215, 171, 118, 202, 130, 201, 125, 250, 89, 71, 
-           240, 173, 212, 162, 175, 156, 164, 114, 192, 183, 253, 147, 38, 54, 63, 247, 204, 52, 165, 229, 241, 113, 
-           216, 49, 21, 4, 199, 35, 195, 24, 150, 5, 154, 7, 18, 128, 226, 235, 39, 178, 117, 9, 131, 44, 26, 27, 110, 
-           90, 160, 82, 59, 214, 179, 41, 227, 47, 132, 83, 209, 0, 237, 32, 252, 177, 91, 106, 203, 190, 57, 74, 76,
-           88, 207, 208, 239, 170, 251, 67, 77, 51, 133, 69, 249, 2, 127, 80, 60, 159, 168, 81, 163, 64, 143, 146, 157,
-           56, 245, 188, 182, 218, 33, 16, 255, 243, 210, 205, 12, 19, 236, 95, 151, 68, 23, 196, 167, 126, 61, 100, 93, 
-           25, 115, 96, 129, 79, 220, 34, 42, 144, 136, 70, 238, 184, 20, 222, 94, 11, 219, 224, 50, 58, 10, 73, 6, 36,
-           92, 194, 211, 172, 98, 145, 149, 228, 121, 231, 200, 55, 109, 141, 213, 78, 169, 108, 86, 244, 234, 101, 122, 
-           174, 8, 186, 120, 37, 46, 28, 166, 180, 198, 232, 221, 116, 31, 75, 189, 139, 138, 112, 62, 181, 102, 72, 3, 
-           246, 14, 97, 53, 87, 185, 134, 193, 29, 158, 225, 248, 152, 17, 105, 217, 142, 148, 155, 30, 135, 233, 206, 
-           85, 40, 223, 140, 161, 137, 13, 191, 230, 66, 104, 65, 153, 45, 15, 176, 84, 187, 22]
     if block_size <= 1 or block_size >= 256 or len(data) >= 2 ** (2 ** 8):
         raise ValueError()
-    size = len(data).to_bytes(8, 'big')
+    return _symmetric_encrypt(data, key, block_size, generate_symmetric_key(-(len(data) + 8) % block_size ** 2))
+
+
+def _symmetric_encrypt(data: bytes, key: bytes, block_size: int, padding: bytes) -> bytes:
+    """
+    symmetric_encrypt with given padding bytes (makes the result reproducible)
+
+    :param data: the data
+    :param key: any key
+    :param block_size: square root of the size of blocks
+    :param padding: -(len(data) + 8) % block_size ** 2 random bytes
+    :return: a cipher text
+    """
+    try:
+        from mmath import bytes_xor_into
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import bytes_xor_into
     block = block_size ** 2
-    data = size + data
-    while len(data) % block != 0:
-        data += generate_symmetric_key(1)
-    blocks = [data[i:i + block] for i in range(0, len(data), block)]
-    key = b'\xc2\xed\x83\xd7' + key + b'\xde\xb2\xae\xbb'
-    first_key = any_hash(key, block, 17)
-    last_key = any_hash(bytes_xor(any_hash(b'\x12\xb0\xa6\x0b' + key, block, 3), first_key), block, 7)
-    keys = []
-    for i in range(len(blocks)):
-        last_key = any_hash(bytes_xor(last_key, first_key) + int_to_bytes(i ** 2 + 1), block, 7)
-        keys.append(last_key)
-    cipher = int_to_bytes(block_size)
-    for i in range(len(blocks)):
-        b = [0 for _ in range(block)]
-        for j in range(block):
-            b[(j * (block_size + 1) + ((block_size + 5) * 7 + 11)) % block] = blocks[i][j]
-        a = []
-        for j in keys[i]:
-            a.append(j)
-        c = []
-        for j in range(block):
-            c.append(a[j] ^ box[b[j]])
-        cipher += bytes(c)
-    return cipher
+    plain = bytearray(8 + len(data) + len(padding))
+    plain[0:8] = len(data).to_bytes(8, 'big')
+    plain[8:8 + len(data)] = data
+    plain[8 + len(data):] = padding
+    if len(plain) % block != 0:
+        raise ValueError('padding has the wrong length')
+    permuted = bytearray(len(plain))
+    for j, k in enumerate(_symmetric_positions(block_size)):
+        permuted[k::block] = plain[j::block]
+    keys = _symmetric_keys(key, block_size, len(plain) // block)
+    cipher = bytearray(1 + len(plain))
+    cipher[0] = block_size
+    cipher[1:] = permuted.translate(_SYMMETRIC_BOX)
+    bytes_xor_into(memoryview(cipher)[1:], keys)
+    return bytes(cipher)
 
 
 def symmetric_decrypt(cipher: bytes, key: bytes) -> bytes:
@@ -294,55 +844,25 @@ def symmetric_decrypt(cipher: bytes, key: bytes) -> bytes:
     :return: the data
     """
     try:
-        from mmath import bytes_xor, int_to_bytes, bytes_to_int
-        from mhash import any_hash
+        from mmath import bytes_xor
     except (ImportError, ModuleNotFoundError):
-        from mmL.mmath import bytes_xor, int_to_bytes, bytes_to_int
-        from mmL.mhash import any_hash
-    i_box = [82, 9, 106, 213, 48, 54, 165, 56, 191, 64, 163, 158, 129, 243, 215, 251, 124, 227, 57, 130, 155, 47, 255,
-             135, 52, 142, 67, 68, 196, 222, 233, 203, 84, 123, 148, 50, 166, 194, 35, 61, 238, 76, 149, 11, 66, 250,
-             195, 78, 8, 46, 161, 102, 40, 217, 36, 178, 118, 91, 162, 73, 109, 139, 209, 37, 114, 248, 246, 100, 134,
-             104, 152, 22, 212, 164, 92, 204, 93, 101, 182, 146, 108, 112, 72, 80, 253, 237, 185, 218, 94, 21, 70, 87,
-             167, 141, 157, 132, 144, 216, 171, 0, 140, 188, 211, 10, 247, 228, 88, 5, 184, 179, 69, 6, 208, 44, 30,
-             143, 202, 63, 15, 2, 193, 175, 189, 3, 1, 19, 138, 107, 58, 145, 17, 65, 79, 103, 220, 234, 151, 242, 207,
-             206, 240, 180, 230, 115, 150, 172, 116, 34, 231, 173, 53, 133, 226, 249, 55, 232, 28, 117, 223, 110, 71,
-             241, 26, 113, 29, 41, 197, 137, 111, 183, 98, 14, 170, 24, 190, 27, 252, 86, 62, 75, 198, 210, 121, 32,
-             154, 219, 192, 254, 120, 205, 90, 244, 31, 221, 168, 51, 136, 7, 199, 49, 177, 18, 16, 89, 39, 128, 236,
-             95, 96, 81, 127, 169, 25, 181, 74, 13, 45, 229, 122, 159, 147, 201, 156, 239, 160, 224, 59, 77, 174, 42,
-             245, 176, 200, 235, 187, 60, 131, 83, 153, 97, 23, 43, 4, 126, 186, 119, 214, 38, 225, 105, 20, 99, 85, 33,
-             12, 125]
+        from mmL.mmath import bytes_xor
     block_size = cipher[0]
     block = block_size ** 2
-    cipher = cipher[1:]
-    blocks = [cipher[i:i + block] for i in range(0, len(cipher), block)]
-    key = b'\xc2\xed\x83\xd7' + key + b'\xde\xb2\xae\xbb'
-    first_key = any_hash(key, block, 17)
-    last_key = any_hash(bytes_xor(any_hash(b'\x12\xb0\xa6\x0b' + key, block, 3), first_key), block, 7)
-    keys = []
-    for i in range(len(blocks)):
-        last_key = any_hash(bytes_xor(last_key, first_key) + int_to_bytes(i ** 2 + 1), block, 7)
-        keys.append(last_key)
-    data = b''
-    for i in range(len(blocks)):
-        a = []
-        for j in keys[i]:
-            a.append(j)
-        b = []
-        for j in range(block):
-            b.append(i_box[a[j] ^ blocks[i][j]])
-        c = []
-        for j in range(block):
-            c.append((j * (block_size + 1) + ((block_size + 5) * 7 + 11)) % block)
-        d = [0 for _ in range(block)]
-        for j in range(block):
-            d[c.index(j)] = b[j]
-        data += bytes(d)
-    size = bytes_to_int(data[0:8])
-    data = data[8:][:size]
-    return data
+    cipher = memoryview(cipher)[1:]
+    if len(cipher) % block != 0:
+        raise ValueError('cipher is corrupted')
+    keys = _symmetric_keys(key, block_size, len(cipher) // block)
+    permuted = bytes_xor(cipher, keys).translate(_SYMMETRIC_I_BOX)
+    data = bytearray(len(cipher))
+    for j, k in enumerate(_symmetric_positions(block_size)):
+        data[j::block] = permuted[k::block]
+    size = int.from_bytes(data[0:8], 'big')
+    return bytes(data[8:8 + size])
 
 
-def rsa_extended_encrypt(data: bytes, e: int, n: int, oe: int, od: int, on: int) -> bytes:
+def rsa_extended_encrypt(data: bytes, e: int, n: int, oe: int, od: int, on: int, version: int = 2,
+                         include_key: bool = True) -> bytes:
     """
     encrypt data using a mix of fernet encryption and the rsa cryptosystem (recommended asymmetric method)
     protects against several kinds of attacks and supports signatures
@@ -351,8 +871,11 @@ def rsa_extended_encrypt(data: bytes, e: int, n: int, oe: int, od: int, on: int)
     :param e: public key (e) of the other person
     :param n: public key (n) of the other person
     :param oe: your public key (e)
-    :param od: your private key
+    :param od: your private key (an RSAPrivateKey is a lot faster)
     :param on: your public key (n)
+    :param version: 2 (text) or 3 (compact binary format)
+    :param include_key: version 3 only: include your public key instead of its fingerprint
+                        (the other person needs to know your key if this is disabled)
     :return: the ciphertext
     """
     from base64 import urlsafe_b64encode, urlsafe_b64decode
@@ -363,81 +886,578 @@ def rsa_extended_encrypt(data: bytes, e: int, n: int, oe: int, od: int, on: int)
         from mmL.mmath import bytes_to_int, int_to_bytes
         from mmL.mhash import sha256
     key = urlsafe_b64encode(generate_symmetric_key(32))
-    cipher = urlsafe_b64encode(symmetric_encrypt(data, key, 8))
-    enc_key = urlsafe_b64encode(int_to_bytes(rsa_encrypt(bytes_to_int(urlsafe_b64decode(key)), e, n)))
-    signature = urlsafe_b64encode(int_to_bytes(rsa_encrypt(bytes_to_int(sha256(data)), od, on)))
-    r = b'\x02.' + enc_key + b'.' + cipher + b'.' + signature + b'.' + \
+    cipher = symmetric_encrypt(data, key, 8)
+    enc_key = rsa_encrypt(bytes_to_int(urlsafe_b64decode(key)), e, n)
+    signature = rsa_decrypt(bytes_to_int(sha256(data)), od, on)
+    if version == 3:
+        return _pack_envelope(2, enc_key, cipher, signature, oe, on, include_key)
+    elif version != 2:
+        raise ValueError('This cipher version is not supported')
+    r = b'\x02.' + urlsafe_b64encode(int_to_bytes(enc_key)) + b'.' + urlsafe_b64encode(cipher) + b'.' + \
+        urlsafe_b64encode(int_to_bytes(signature)) + b'.' + \
         urlsafe_b64encode(int_to_bytes(oe)) + b'.' + urlsafe_b64encode(int_to_bytes(on))
     return r
 
 
-def rsa_extended_decrypt(cipher: bytes, d: int, n: int, disable_checksum: bool = False) -> bytes:
+def rsa_extended_decrypt(cipher: bytes, d: int, n: int, disable_checksum: bool = False, keys: dict = None) -> bytes:
     """
     decrypt data using a mix of fernet encryption and the rsa cryptosystem
 
     :param cipher: the ciphertext
-    :param d: your private key
-    :param n:your public key (n)
+    :param d: your private key (an RSAPrivateKey is a lot faster)
+    :param n: your public key (n)
     :param disable_checksum: disable signature checks (NOT recommended)
+    :param keys: known public keys {rsa_fingerprint(e, n): (e, n)} (for version 3 ciphers without the sender's key)
     :return: the plaintext
     """
-    from base64 import urlsafe_b64encode, urlsafe_b64decode
+    from base64 import urlsafe_b64encode
     try:
         from mmath import bytes_to_int, int_to_bytes
         from mhash import sha256
     except (ImportError, ModuleNotFoundError):
         from mmL.mmath import bytes_to_int, int_to_bytes
         from mmL.mhash import sha256
-    c = cipher.split(b'.')
-    if len(c) != 6:
-        raise ValueError('cipher is corrupted')
-    if c[0] != b'\x02':
-        raise ValueError('This cipher version is not supported')
-    key = urlsafe_b64encode(int_to_bytes(rsa_decrypt(bytes_to_int(urlsafe_b64decode(c[1])), d, n)))
-    while len(key) < 32:
-        key = b'\x00' + key
-    data = symmetric_decrypt(urlsafe_b64decode(c[2]), key)
+    version, enc_key, body, signature, oe, on = _read_envelope(cipher, True, keys)
+    key = urlsafe_b64encode(int_to_bytes(rsa_decrypt(enc_key, d, n), 32))
+    data = symmetric_decrypt(body, key)
     if disable_checksum:
         return data
+    if on is None:
+        raise ValueError('The sender of this cipher is unknown')
     hashed = sha256(data)
-    oe = bytes_to_int(urlsafe_b64decode(c[4]))
-    on = bytes_to_int(urlsafe_b64decode(c[5]))
-    signature = int_to_bytes(rsa_decrypt(bytes_to_int(urlsafe_b64decode(c[3])), oe, on))
-    if signature != hashed:
+    if rsa_decrypt(signature, oe, on) != bytes_to_int(hashed):
         raise ValueError('Signature is invalid')
     return data
 
 
-def rsa_extended_signature(cipher: bytes, d: int, n: int) -> [bool, int, int, int]:
+def rsa_extended_signature(cipher: bytes, d: int, n: int, keys: dict = None) -> [bool, int, int, int]:
     """
-    get information about a cipher
+    get information about a cipher (use rsa_extended_open if you also need the plaintext)
 
     :param cipher: the ciphertext
-    :param d: your private key
+    :param d: your private key (an RSAPrivateKey is a lot faster)
     :param n: your public key (n)
+    :param keys: known public keys {rsa_fingerprint(e, n): (e, n)} (for version 3 ciphers without the sender's key)
     :return: [has valid signature; public key (e) of sender; public key (n) of sender; version]
     """
-    from base64 import urlsafe_b64encode, urlsafe_b64decode
+    return rsa_extended_open(cipher, d, n, keys)[1:]
+
+
+def rsa_extended_open(cipher: bytes, d: int, n: int, keys: dict = None) -> [bytes, bool, int, int, int]:
+    """
+    decrypt a cipher and check its signature at once (faster than rsa_extended_decrypt and rsa_extended_signature)
+
+    :param cipher: the ciphertext
+    :param d: your private key (an RSAPrivateKey is a lot faster)
+    :param n: your public key (n)
+    :param keys: known public keys {rsa_fingerprint(e, n): (e, n)} (for version 3 ciphers without the sender's key)
+    :return: [plaintext; has valid signature; public key (e) of sender; public key (n) of sender; version]
+    """
+    from base64 import urlsafe_b64encode
     try:
         from mmath import bytes_to_int, int_to_bytes
         from mhash import sha256
     except (ImportError, ModuleNotFoundError):
         from mmL.mmath import bytes_to_int, int_to_bytes
         from mmL.mhash import sha256
-    c = cipher.split(b'.')
-    if len(c) != 6:
+    version, enc_key, body, signature, oe, on = _read_envelope(cipher, True, keys)
+    if on is None:
+        raise ValueError('The sender of this cipher is unknown')
+    key = urlsafe_b64encode(int_to_bytes(rsa_decrypt(enc_key, d, n), 32))
+    data = symmetric_decrypt(body, key)
+    hashed = sha256(data)
+    return [data, rsa_decrypt(signature, oe, on) == bytes_to_int(hashed), oe, on, version]
+
+
+def _stream_chunks(source, chunk_size: int):
+    """
+    split bytes, a file object or an iterable of bytes into chunks
+    (files on disk are memory-mapped instead of read)
+
+    :param source: the data
+    :param chunk_size: the maximum size of chunks in bytes
+    :return: a generator of the chunks
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = memoryview(source)
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size]
+        return
+    if hasattr(source, 'read'):
+        try:
+            from mmap import mmap, ACCESS_READ
+            from os import fstat
+            from stat import S_ISREG
+            start = source.tell()
+            if not S_ISREG(fstat(source.fileno()).st_mode) or fstat(source.fileno()).st_size <= start:
+                raise OSError()
+            m = mmap(source.fileno(), 0, access=ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            m = None
+        if m is not None:
+            try:
+                for i in range(start, len(m), chunk_size):
+                    yield m[i:i + chunk_size]
+                source.seek(len(m))
+            finally:
+                m.close()
+            return
+        while True:
+            x = source.read(chunk_size)
+            if not x:
+                return
+            yield x
+    buffer = bytearray()
+    for i in source:
+        buffer += i
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[0:chunk_size])
+            del buffer[0:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _stream_reader(source):
+    """
+    get a function which reads an exact number of bytes from bytes, a file object or an iterable of bytes
+
+    :param source: the data
+    :return: read(number_of_bytes) -> bytes (shorter only at the end of the data)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        from io import BytesIO
+        source = BytesIO(source)
+    if hasattr(source, 'read'):
+        def read(number_of_bytes):
+            r = source.read(number_of_bytes)
+            while 0 < len(r) < number_of_bytes:
+                x = source.read(number_of_bytes - len(r))
+                if not x:
+                    break
+                r += x
+            return r
+        return read
+    iterator = iter(source)
+    buffer = bytearray()
+    position = [0]
+
+    def read(number_of_bytes):
+        i = position[0]
+        if len(buffer) - i < number_of_bytes:
+            # drop the bytes which were read already, so that the buffer only holds about one item
+            del buffer[0:i]
+            i = 0
+            for x in iterator:
+                buffer.extend(x)
+                if len(buffer) >= number_of_bytes:
+                    break
+        r = bytes(buffer[i:i + number_of_bytes])
+        position[0] = i + len(r)
+        return r
+    return read
+
+
+def _encrypt_chunk(kind: int, key: bytes, block_size: int, index: int, final: bool, data: bytes,
+                   padding: bytes = None) -> bytes:
+    """
+    encrypt one chunk of a chunked cipher
+
+    :param kind: 1 (fernet) or 2 (symmetric_encrypt)
+    :param key: the key (raw 32 bytes for fernet)
+    :param block_size: square root of the size of blocks (symmetric_encrypt only)
+    :param index: the number of the chunk
+    :param final: this is the last chunk
+    :param data: the plaintext of the chunk
+    :param padding: symmetric_encrypt only: the random padding (see _chunk_padding)
+    :return: the encrypted chunk
+    """
+    from base64 import urlsafe_b64encode, urlsafe_b64decode
+    data = index.to_bytes(8, 'big') + bytes([final]) + data
+    if kind == 1:
+        return urlsafe_b64decode(fernet_encrypt(data, urlsafe_b64encode(key)))
+    if padding is None:
+        return symmetric_encrypt(data, key + index.to_bytes(8, 'big'), block_size)
+    return _symmetric_encrypt(data, key + index.to_bytes(8, 'big'), block_size, padding)
+
+
+def _chunk_padding(block_size: int, size: int) -> bytes:
+    """
+    draw the random padding of a chunk (symmetric_encrypt) before it is encrypted
+
+    :param block_size: square root of the size of blocks
+    :param size: the size of the plaintext of the chunk
+    :return: the padding
+    """
+    return generate_symmetric_key(-(size + 9 + 8) % block_size ** 2)
+
+
+def _chunk_worker(task: tuple) -> (bool, int):
+    """
+    encrypt or decrypt one chunk (symmetric_encrypt) in a worker process, using shared memory for input and output
+
+    :param task: (encrypt, name of input memory, offset, size, name of output memory, offset, key, block_size, index,
+                 final, padding)
+    :return: (this is the last chunk, size of the output)
+    """
+    from multiprocessing.shared_memory import SharedMemory
+    encrypt, in_name, in_offset, in_size, out_name, out_offset, key, block_size, index, final, padding = task
+    i = SharedMemory(in_name)
+    o = SharedMemory(out_name)
+    try:
+        data = bytes(i.buf[in_offset:in_offset + in_size])
+        if encrypt:
+            r = _encrypt_chunk(2, key, block_size, index, final, data, padding)
+        else:
+            final, r = _decrypt_chunk(2, key, index, data)
+        o.buf[out_offset:out_offset + len(r)] = r
+    finally:
+        i.close()
+        o.close()
+    return final, len(r)
+
+
+def _parallel_chunks(executor, encrypt: bool, key: bytes, block_size: int, chunks: list) -> list:
+    """
+    encrypt or decrypt several chunks (symmetric_encrypt) at once in a process pool
+    the chunks are copied into shared memory once and the workers write their results into shared memory
+
+    :param executor: a concurrent.futures.ProcessPoolExecutor
+    :param encrypt: encrypt (True) or decrypt (False)
+    :param key: the key
+    :param block_size: square root of the size of blocks
+    :param chunks: [(index, final, data, padding)] (final and padding are ignored while decrypting)
+    :return: [(final, output)]
+    """
+    from multiprocessing.shared_memory import SharedMemory
+    sizes = [len(i[2]) for i in chunks]
+    if encrypt:
+        out_sizes = [1 + 17 + sizes[i] + len(chunks[i][3]) for i in range(len(chunks))]
+    else:
+        out_sizes = sizes
+    i_memory = SharedMemory(create=True, size=max(1, sum(sizes)))
+    o_memory = SharedMemory(create=True, size=max(1, sum(out_sizes)))
+    try:
+        tasks = []
+        in_offset = 0
+        out_offset = 0
+        for j in range(len(chunks)):
+            index, final, data, padding = chunks[j]
+            i_memory.buf[in_offset:in_offset + sizes[j]] = data
+            tasks.append((encrypt, i_memory.name, in_offset, sizes[j], o_memory.name, out_offset, key, block_size,
+                          index, final, padding))
+            in_offset += sizes[j]
+            out_offset += out_sizes[j]
+        r = []
+        out_offset = 0
+        for j, (final, size) in enumerate(executor.map(_chunk_worker, tasks)):
+            r.append((final, bytes(o_memory.buf[out_offset:out_offset + size])))
+            out_offset += out_sizes[j]
+        return r
+    finally:
+        i_memory.close()
+        i_memory.unlink()
+        o_memory.close()
+        o_memory.unlink()
+
+
+def _decrypt_chunk(kind: int, key: bytes, index: int, cipher: bytes) -> (bool, bytes):
+    """
+    decrypt one chunk of a chunked cipher
+
+    :param kind: 1 (fernet) or 2 (symmetric_encrypt)
+    :param key: the key (raw 32 bytes for fernet)
+    :param index: the expected number of the chunk
+    :param cipher: the encrypted chunk
+    :return: (this is the last chunk, the plaintext of the chunk)
+    """
+    from base64 import urlsafe_b64encode
+    if kind == 1:
+        data = fernet_decrypt(urlsafe_b64encode(cipher), urlsafe_b64encode(key))
+    else:
+        data = symmetric_decrypt(cipher, key + index.to_bytes(8, 'big'))
+    if len(data) < 9 or int.from_bytes(data[0:8], 'big') != index or data[8] > 1:
+        raise ValueError('cipher is corrupted')
+    return bool(data[8]), data[9:]
+
+
+def _chunked_encrypt(source, kind: int, key: bytes, block_size: int, chunk_size: int, enc_key: bytes = b'',
+                     hashed=None, workers: int = None):
+    """
+    encrypt data into a chunked cipher:
+    b'mmLC' + version (1) + kind (1 byte) + chunk size (4 bytes) + encrypted key length (2 bytes) + encrypted key +
+    chunks (length (4 bytes, the highest bit marks the last chunk) + encrypted chunk);
+    every chunk also contains its number and whether it is the last one
+
+    :return: a generator of the parts of the cipher
+    """
+    if chunk_size < 1 or chunk_size >= 2 ** 31 - 4096:
+        raise ValueError('chunk_size is not supported')
+    # the reader accepts chunks up to chunk_size + 4096 bytes; symmetric_encrypt adds up to 17 + block_size ** 2 bytes
+    # (block size, length, chunk number and padding), which limits block_size to 63
+    if kind == 2 and 17 + block_size ** 2 > 4096:
+        raise ValueError('block_size is not supported in streams (at most 63)')
+    yield b'mmLC\x01' + bytes([kind]) + chunk_size.to_bytes(4, 'big') + len(enc_key).to_bytes(2, 'big') + enc_key
+    chunks = _stream_chunks(source, chunk_size)
+    executor = None
+    if workers is not None and workers > 1 and kind == 2:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(workers)
+    try:
+        index = 0
+        current = next(chunks, b'')
+        batch = []
+        while current is not None:
+            following = next(chunks, None)
+            if hashed is not None:
+                hashed.update(current)
+            padding = _chunk_padding(block_size, len(current)) if kind == 2 else None
+            batch.append((index, following is None, bytes(current), padding))
+            current = following
+            index += 1
+            if executor is None:
+                results = [(i[1], _encrypt_chunk(kind, key, block_size, *i)) for i in batch]
+            elif len(batch) >= 2 * workers or current is None:
+                results = _parallel_chunks(executor, True, key, block_size, batch)
+            else:
+                continue
+            for final, c in results:
+                yield (len(c) | (final << 31)).to_bytes(4, 'big') + c
+            batch = []
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _chunked_decrypt(read, kind: int, key: bytes, chunk_size: int, hashed=None, workers: int = None):
+    """
+    decrypt the chunks of a chunked cipher (the header has to be read already)
+
+    :return: a generator of the parts of the plaintext
+    """
+    executor = None
+    if workers is not None and workers > 1 and kind == 2:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(workers)
+    try:
+        index = 0
+        final = False
+        while not final:
+            batch = []
+            while not final and (executor is not None or not batch) and len(batch) < 2 * (workers or 1):
+                size = read(4)
+                if len(size) != 4 or int.from_bytes(size, 'big') & 0x7fffffff > chunk_size + 4096:
+                    raise ValueError('cipher is corrupted')
+                final = bool(size[0] & 0x80)
+                size = int.from_bytes(size, 'big') & 0x7fffffff
+                c = read(size)
+                if len(c) != size:
+                    raise ValueError('cipher is corrupted')
+                batch.append((index, final, c, None))
+                index += 1
+            if executor is None:
+                results = [_decrypt_chunk(kind, key, i[0], i[2]) for i in batch]
+            else:
+                results = _parallel_chunks(executor, False, key, 0, batch)
+            for j in range(len(batch)):
+                if results[j][0] != batch[j][1]:
+                    raise ValueError('cipher is corrupted')
+                if hashed is not None:
+                    hashed.update(results[j][1])
+                yield results[j][1]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _read_chunked_header(read, kinds: list) -> (int, int, bytes):
+    """
+    read the header of a chunked cipher
+
+    :return: (kind, chunk size, encrypted key)
+    """
+    header = read(12)
+    if len(header) != 12 or header[0:4] != b'mmLC':
         raise ValueError('cipher is corrupted')
-    if c[0] != b'\x02':
+    if header[4] != 1 or header[5] not in kinds:
         raise ValueError('This cipher version is not supported')
-    key = urlsafe_b64encode(int_to_bytes(rsa_decrypt(bytes_to_int(urlsafe_b64decode(c[1])), d, n)))
-    while len(key) < 32:
-        key = b'\x00' + key
-    data = symmetric_decrypt(urlsafe_b64decode(c[2]), key)
-    hashed = sha256(data)
-    oe = bytes_to_int(urlsafe_b64decode(c[4]))
-    on = bytes_to_int(urlsafe_b64decode(c[5]))
-    signature = int_to_bytes(rsa_decrypt(bytes_to_int(urlsafe_b64decode(c[3])), oe, on))
-    if signature == hashed:
-        return [True, oe, on, bytes_to_int(c[0])]
+    enc_key = read(int.from_bytes(header[10:12], 'big'))
+    return header[5], int.from_bytes(header[6:10], 'big'), enc_key
+
+
+def _write_stream(parts, destination):
+    """
+    write the parts of a stream to a file object or return them as a generator if there's no destination
+    """
+    if destination is None:
+        return parts
+    for i in parts:
+        destination.write(i)
+
+
+def symmetric_encrypt_stream(source, destination, key: bytes, block_size: int = 4, chunk_size: int = 1048576,
+                             workers: int = None):
+    """
+    symmetrically encrypt data of any size in chunks with constant memory usage (chunked cipher)
+
+    :param source: the data (bytes, a file object or an iterable of bytes)
+    :param destination: a file object, or None to get a generator of the parts of the cipher
+    :param key: any key
+    :param block_size: square root of the size of blocks (at most 63)
+    :param chunk_size: size of chunks in bytes
+    :param workers: number of processes which encrypt chunks in parallel (the result is the same)
+    :return: None (or a generator of bytes if destination is None)
+    """
+    return _write_stream(_chunked_encrypt(source, 2, key, block_size, chunk_size, workers=workers), destination)
+
+
+def symmetric_decrypt_stream(source, destination, key: bytes, workers: int = None):
+    """
+    decrypt ciphers created by symmetric_encrypt_stream incrementally
+
+    :param source: the cipher (bytes, a file object or an iterable of bytes)
+    :param destination: a file object, or None to get a generator of the parts of the data
+    :param key: the key
+    :param workers: number of processes which decrypt chunks in parallel
+    :return: None (or a generator of bytes if destination is None)
+    """
+    def parts():
+        read = _stream_reader(source)
+        kind, chunk_size, _ = _read_chunked_header(read, [2])
+        yield from _chunked_decrypt(read, kind, key, chunk_size, workers=workers)
+    return _write_stream(parts(), destination)
+
+
+def _rsa_encrypt_stream(source, kind: int, e: int, n: int, oe: int, od: int, on: int, block_size: int,
+                        chunk_size: int, include_key: bool, workers: int = None):
+    """
+    encrypt data with a random key, which is encrypted with rsa, and sign it (chunked cipher)
+    after the last chunk: signature length (2 bytes) + signature + sender (fingerprint (16 bytes) or e and n with a 2
+    byte length each, flag 1 marks the full key)
+
+    :return: a generator of the parts of the cipher
+    """
+    from hashlib import sha3_256
+    try:
+        from mmath import bytes_to_int, int_to_bytes
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import bytes_to_int, int_to_bytes
+    key = generate_symmetric_key(32)
+    enc_key = int_to_bytes(rsa_encrypt(bytes_to_int(key), e, n))
+    hashed = sha3_256()
+    yield from _chunked_encrypt(source, kind, key, block_size, chunk_size, enc_key, hashed, workers)
+    signature = int_to_bytes(rsa_decrypt(bytes_to_int(hashed.digest()), od, on))
+    r = [len(signature).to_bytes(2, 'big'), signature, bytes([int(include_key)])]
+    if include_key:
+        for i in (int_to_bytes(oe), int_to_bytes(on)):
+            r += [len(i).to_bytes(2, 'big'), i]
+    else:
+        r.append(rsa_fingerprint(oe, on))
+    yield b''.join(r)
+
+
+def _rsa_decrypt_stream(source, kinds: list, d: int, n: int, disable_checksum: bool, keys: dict, workers: int = None):
+    """
+    decrypt data created by _rsa_encrypt_stream and check the signature at the end
+
+    :return: a generator of the parts of the plaintext
+    """
+    from hashlib import sha3_256
+    try:
+        from mmath import bytes_to_int, int_to_bytes
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import bytes_to_int, int_to_bytes
+    read = _stream_reader(source)
+    kind, chunk_size, enc_key = _read_chunked_header(read, kinds)
+    key = int_to_bytes(rsa_decrypt(bytes_to_int(enc_key), d, n), 32)
+    hashed = sha3_256()
+    yield from _chunked_decrypt(read, kind, key, chunk_size, hashed, workers)
+    if disable_checksum:
+        return
+    signature = bytes_to_int(read(int.from_bytes(read(2), 'big')))
+    if read(1) == b'\x01':
+        oe = bytes_to_int(read(int.from_bytes(read(2), 'big')))
+        on = bytes_to_int(read(int.from_bytes(read(2), 'big')))
     else:
-        return [False, oe, on, bytes_to_int(c[0])]
+        fingerprint = read(16)
+        if len(fingerprint) != 16:
+            raise ValueError('cipher is corrupted')
+        oe, on = (keys or {}).get(fingerprint, (None, None))
+        if on is None:
+            raise ValueError('The sender of this cipher is unknown')
+    if rsa_decrypt(signature, oe, on) != bytes_to_int(hashed.digest()):
+        raise ValueError('Signature is invalid')
+
+
+def rsa_fernet_encrypt_stream(source, destination, e: int, n: int, oe: int, od: int, on: int,
+                              chunk_size: int = 1048576, include_key: bool = True):
+    """
+    encrypt data of any size like rsa_fernet_encrypt, in chunks with constant memory usage (chunked cipher)
+
+    :param source: the plaintext (bytes, a file object or an iterable of bytes)
+    :param destination: a file object, or None to get a generator of the parts of the cipher
+    :param e: public key (e) of the other person
+    :param n: public key (n) of the other person
+    :param oe: your public key (e)
+    :param od: your private key (an RSAPrivateKey is a lot faster)
+    :param on: your public key (n)
+    :param chunk_size: size of chunks in bytes
+    :param include_key: include your public key instead of its fingerprint
+    :return: None (or a generator of bytes if destination is None)
+    """
+    return _write_stream(_rsa_encrypt_stream(source, 1, e, n, oe, od, on, 0, chunk_size, include_key), destination)
+
+
+def rsa_fernet_decrypt_stream(source, destination, d: int, n: int, disable_checksum: bool = False,
+                              keys: dict = None):
+    """
+    decrypt ciphers created by rsa_fernet_encrypt_stream incrementally
+    (the signature is checked at the end, after all data was written)
+
+    :param source: the ciphertext (bytes, a file object or an iterable of bytes)
+    :param destination: a file object, or None to get a generator of the parts of the plaintext
+    :param d: your private key (an RSAPrivateKey is a lot faster)
+    :param n: your public key (n)
+    :param disable_checksum: disable signature checks (NOT recommended)
+    :param keys: known public keys {rsa_fingerprint(e, n): (e, n)} (for ciphers without the sender's key)
+    :return: None (or a generator of bytes if destination is None)
+    """
+    return _write_stream(_rsa_decrypt_stream(source, [1], d, n, disable_checksum, keys), destination)
+
+
+def rsa_extended_encrypt_stream(source, destination, e: int, n: int, oe: int, od: int, on: int,
+                                chunk_size: int = 1048576, include_key: bool = True, workers: int = None):
+    """
+    encrypt data of any size like rsa_extended_encrypt, in chunks with constant memory usage (chunked cipher)
+
+    :param source: the plaintext (bytes, a file object or an iterable of bytes)
+    :param destination: a file object, or None to get a generator of the parts of the cipher
+    :param e: public key (e) of the other person
+    :param n: public key (n) of the other person
+    :param oe: your public key (e)
+    :param od: your private key (an RSAPrivateKey is a lot faster)
+    :param on: your public key (n)
+    :param chunk_size: size of chunks in bytes
+    :param include_key: include your public key instead of its fingerprint
+    :param workers: number of processes which encrypt chunks in parallel (the result is the same)
+    :return: None (or a generator of bytes if destination is None)
+    """
+    return _write_stream(_rsa_encrypt_stream(source, 2, e, n, oe, od, on, 8, chunk_size, include_key, workers),
+                         destination)
+
+
+def rsa_extended_decrypt_stream(source, destination, d: int, n: int, disable_checksum: bool = False,
+                                keys: dict = None, workers: int = None):
+    """
+    decrypt ciphers created by rsa_extended_encrypt_stream incrementally
+    (the signature is checked at the end, after all data was written)
+
+    :param source: the ciphertext (bytes, a file object or an iterable of bytes)
+    :param destination: a file object, or None to get a generator of the parts of the plaintext
+    :param d: your private key (an RSAPrivateKey is a lot faster)
+    :param n: your public key (n)
+    :param disable_checksum: disable signature checks (NOT recommended)
+    :param keys: known public keys {rsa_fingerprint(e, n): (e, n)} (for ciphers without the sender's key)
+    :param workers: number of processes which decrypt chunks in parallel
+    :return: None (or a generator of bytes if destination is None)
+    """
+    return _write_stream(_rsa_decrypt_stream(source, [2], d, n, disable_checksum, keys, workers), destination)
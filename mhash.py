@@ -41,8 +41,9 @@ def any_hash(obj: bytes, length: int = 16, iterations: int = 1) -> bytes:
         from mmL.mmath import bytes_xor
     h = b''
     for i in range(iterations):
-        h = sha512(obj)
+        first = sha512(obj)
+        h = first
         while len(h) < length:
-            h += sha512(bytes_xor(sha512(obj), h, True))
+            h += sha512(bytes_xor(first, h, True))
         obj = h
     return h[0:length]
@@ -1,44 +1,359 @@
 
 
-def miller_prime(n: int, iterations: int = 48) -> bool:
+_DETERMINISTIC_BASES = ((2047, (2,)), (1373653, (2, 3)), (25326001, (2, 3, 5)), (3215031751, (2, 3, 5, 7)),
+                        (2152302898747, (2, 3, 5, 7, 11)), (3474749660383, (2, 3, 5, 7, 11, 13)),
+                        (341550071728321, (2, 3, 5, 7, 11, 13, 17)),
+                        (3825123056546413051, (2, 3, 5, 7, 11, 13, 17, 19, 23)),
+                        (318665857834031151167461, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)),
+                        (3317044064679887385961981, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)))
+
+
+def _strong_probable_prime(n: int, a: int, s: int, r: int) -> bool:
     """
-    check if a number is prime using the miller method (may incorrectly indentify numbers as prime)
+    one round of the miller-rabin test
 
-    :param n: the number
-    :param iterations: higher values -> higher accuracy -> more resource usage;
-                       lower values -> lower accuracy -> less resource usage
+    :param n: an odd integer > 3
+    :param a: the base (witness)
+    :param s: odd part of n - 1
+    :param r: n - 1 = s * 2^r
+    :return: True (n is a strong probable prime to base a) or False (n is NOT a prime)
+    """
+    x = pow(a, s, n)
+    if x == 1 or x == n - 1:
+        return True
+    for _ in range(r - 1):
+        x = x * x % n
+        if x == n - 1:
+            return True
+    return False
+
+
+def _jacobi(a: int, n: int) -> int:
+    """
+    calculate the jacobi symbol (a/n)
+
+    :param a: any integer
+    :param n: an odd positive integer
+    :return: -1, 0 or 1
+    """
+    a %= n
+    r = 1
+    while a != 0:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                r = -r
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            r = -r
+        a %= n
+    return r if n == 1 else 0
+
+
+def _lucas_prime(n: int) -> bool:
+    """
+    strong lucas probable prime test with the parameters of selfridge (method A)
+
+    :param n: an odd integer > 3 which isn't a perfect square
+    :return: True (is a strong lucas probable prime) or False (is NOT a prime)
+    """
+    d = 5
+    while True:
+        j = _jacobi(d, n)
+        if j == -1:
+            break
+        if j == 0 and abs(d) != n:
+            return False
+        d = -d - 2 if d > 0 else -d + 2
+    q = (1 - d) // 4
+    k = n + 1
+    r = 0
+    while k % 2 == 0:
+        r += 1
+        k //= 2
+    u, v, q_k = 1, 1, q % n
+    for bit in bin(k)[3:]:
+        u = u * v % n
+        v = (v * v - 2 * q_k) % n
+        q_k = q_k * q_k % n
+        if bit == '1':
+            u, v = (u + v) % n, (d * u + v) % n
+            if u % 2 == 1:
+                u += n
+            if v % 2 == 1:
+                v += n
+            u //= 2
+            v //= 2
+            q_k = q_k * q % n
+    if u == 0 or v == 0:
+        return True
+    for _ in range(r - 1):
+        v = (v * v - 2 * q_k) % n
+        q_k = q_k * q_k % n
+        if v == 0:
+            return True
+    return False
+
+
+def is_probable_prime(n: int, rounds: int = 0) -> bool:
+    """
+    check if an integer is a prime: trial division by the primes below 1000,
+    deterministic miller-rabin bases for n < 3.3e24 (always correct)
+    and baillie-psw for bigger n (no counterexample is known)
+
+    :param n: any integer
+    :param rounds: additional miller-rabin rounds with random bases (paranoid mode)
     :return: True (is a prime) or False (is NOT a prime)
     """
-    try:
-        from mrandom import randint
-    except (ImportError, ModuleNotFoundError):
-        from mmL.mrandom import randint
     if n < 2:
         return False
-    if n in [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47]:
+    for p in _small_primes()[:168]:
+        if n % p == 0:
+            return n == p
+    if n < 994009:
         return True
-    for i in [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47]:
-        if n % i == 0:
-            return False
-    r = 0
     s = n - 1
+    r = 0
     while s % 2 == 0:
         r += 1
         s //= 2
-    for i in range(iterations):
-        a = randint(2, n - 1)
-        x = pow(a, s, n)
-        if x == 1 or x == n - 1:
-            continue
-        for j in range(r - 1):
-            x = pow(x, 2, n)
-            if x == n - 1:
-                break
-        else:
+    for limit, bases in _DETERMINISTIC_BASES:
+        if n < limit:
+            for a in bases:
+                if not _strong_probable_prime(n, a, s, r):
+                    return False
+            break
+    else:
+        if not _strong_probable_prime(n, 2, s, r):
+            return False
+        x = isqrt(n)
+        if x * x == n or not _lucas_prime(n):
             return False
+    if rounds > 0:
+        try:
+            from mrandom import randbelow
+        except (ImportError, ModuleNotFoundError):
+            from mmL.mrandom import randbelow
+        for _ in range(rounds):
+            if not _strong_probable_prime(n, 2 + randbelow(n - 3), s, r):
+                return False
     return True
 
 
+def miller_prime(n: int, iterations: int = 0) -> bool:
+    """
+    check if a number is prime (see is_probable_prime)
+
+    :param n: the number
+    :param iterations: additional miller-rabin rounds with random bases (paranoid mode),
+                       not needed for the accuracy below 3.3e24
+    :return: True (is a prime) or False (is NOT a prime)
+    """
+    return is_probable_prime(n, iterations)
+
+
+_SMALL_PRIMES = []
+_SMALL_PRIMES_LIMIT = 0
+_PRIME_TABLE = None
+
+
+def _small_primes(limit: int = 65536) -> list:
+    """
+    get all primes below (at least) limit; the list is shared by the whole process,
+    calculated once and extended by the segmented sieve (or read from the prime table) when needed
+
+    :param limit: the primes have to be complete up to this number
+    :return: the primes (don't modify the list)
+    """
+    from itertools import compress
+    global _SMALL_PRIMES_LIMIT
+    if _SMALL_PRIMES_LIMIT == 0:
+        sieve = bytearray([1]) * 65536
+        sieve[0:2] = b'\x00\x00'
+        for i in range(2, 256):
+            if sieve[i]:
+                sieve[i * i::i] = bytes(len(range(i * i, 65536, i)))
+        _SMALL_PRIMES.extend(compress(range(65536), sieve))
+        _SMALL_PRIMES_LIMIT = 65536
+    if limit > _SMALL_PRIMES_LIMIT:
+        if _PRIME_TABLE is not None and _PRIME_TABLE.limit >= limit:
+            _SMALL_PRIMES.extend(_PRIME_TABLE.primes_in_range(_SMALL_PRIMES_LIMIT, _PRIME_TABLE.limit))
+            _SMALL_PRIMES_LIMIT = _PRIME_TABLE.limit
+        else:
+            _SMALL_PRIMES.extend(_sieve_segment(_SMALL_PRIMES_LIMIT, limit))
+            _SMALL_PRIMES_LIMIT = limit
+    return _SMALL_PRIMES
+
+
+def _sieve_segment(a: int, b: int) -> list:
+    """
+    sieve one segment with the cached primes below sqrt(b)
+
+    :param a: start (inclusive)
+    :param b: end (exclusive)
+    :return: the primes in [a, b)
+    """
+    from itertools import compress
+    a = max(a, 2)
+    if b <= a:
+        return []
+    sieve = bytearray([1]) * (b - a)
+    for p in _small_primes(isqrt(b - 1) + 1):
+        if p * p >= b:
+            break
+        i = max(p * p, (a + p - 1) // p * p) - a
+        sieve[i::p] = bytes(len(range(i, b - a, p)))
+    return list(compress(range(a, b), sieve))
+
+
+def primes_in_range(a: int, b: int, segment: int = 1048576) -> list:
+    """
+    get all primes in a range (segmented sieve of eratosthenes),
+    the memory usage depends on the segment size and sqrt(b), not on the size of the range
+
+    :param a: start (inclusive)
+    :param b: end (exclusive)
+    :param segment: number of integers which are sieved at once
+    :return: the primes in [a, b)
+    """
+    from bisect import bisect_left
+    if b <= _SMALL_PRIMES_LIMIT:
+        return _SMALL_PRIMES[bisect_left(_SMALL_PRIMES, a):bisect_left(_SMALL_PRIMES, b)]
+    if _PRIME_TABLE is not None and _PRIME_TABLE.limit >= b:
+        return _PRIME_TABLE.primes_in_range(a, b)
+    r = []
+    for i in range(max(a, 2), b, segment):
+        r.extend(_sieve_segment(i, min(i + segment, b)))
+    return r
+
+
+def iter_primes(start: int = 2, stop: int = None, segment: int = 1048576):
+    """
+    generate the primes in ascending order (segmented sieve of eratosthenes)
+
+    :param start: the first number (inclusive)
+    :param stop: the end (exclusive), None = infinite
+    :param segment: number of integers which are sieved at once
+    :return: a generator of the primes
+    """
+    i = max(start, 2)
+    while stop is None or i < stop:
+        j = i + segment if stop is None else min(i + segment, stop)
+        yield from primes_in_range(i, j, segment)
+        i = j
+
+
+class PrimeTable:
+    """
+    A sorted table of all primes below a limit, stored in a file and memory-mapped,
+    so that repeated runs don't have to sieve again
+    """
+
+    def __init__(self, path: str, limit: int = 16777216) -> None:
+        """
+        :param path: the file of the table (it is created if it doesn't exist or doesn't cover limit)
+        :param limit: the table contains all primes below this number
+        """
+        from os import path as os_path, replace
+        from mmap import mmap, ACCESS_READ
+        from array import array
+        if os_path.isfile(path):
+            with open(path, 'rb') as f:
+                header = f.read(16)
+        else:
+            header = b''
+        if len(header) != 16 or header[0:8] != b'mmLP\x01\x00\x00\x00' or \
+                int.from_bytes(header[8:16], 'big') < limit:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(b'mmLP\x01\x00\x00\x00' + limit.to_bytes(8, 'big'))
+                for i in range(0, limit, 1048576):
+                    array('Q', _sieve_segment(i, min(i + 1048576, limit))).tofile(f)
+            replace(path + '.tmp', path)
+        self.path = path
+        self._file = open(path, 'rb')
+        self.limit = int.from_bytes(self._file.read(16)[8:16], 'big')
+        if self.limit < 3:
+            self._map = None
+            self._primes = []
+        else:
+            self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+            self._primes = memoryview(self._map)[16:].cast('Q')
+
+    def __len__(self) -> int:
+        return len(self._primes)
+
+    def __contains__(self, n: int) -> bool:
+        from bisect import bisect_left
+        i = bisect_left(self._primes, n)
+        return i < len(self._primes) and self._primes[i] == n
+
+    def __iter__(self):
+        return iter(self._primes)
+
+    def primes_in_range(self, a: int, b: int) -> list:
+        """
+        get all primes in a range (b may not be bigger than the limit of the table)
+
+        :param a: start (inclusive)
+        :param b: end (exclusive)
+        :return: the primes in [a, b)
+        """
+        from bisect import bisect_left
+        if b > self.limit:
+            raise ValueError('The table only contains primes below ' + str(self.limit))
+        return self._primes[bisect_left(self._primes, a):bisect_left(self._primes, b)].tolist()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._primes.release()
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def set_prime_table(table) -> None:
+    """
+    set the table which is used instead of sieving (for primes below its limit)
+
+    :param table: a PrimeTable or None
+    """
+    global _PRIME_TABLE
+    _PRIME_TABLE = table
+
+
+def prime_candidates(start: int, window: int = 4096):
+    """
+    generate all odd numbers >= start which aren't divisible by any prime below 65536 (except the prime itself)
+    the numbers are sieved in windows, only these candidates need an expensive primality test
+
+    :param start: the first number
+    :param window: the number of odd numbers which are sieved at once
+    :return: a generator of the candidates (in ascending order)
+    """
+    from bisect import bisect_left
+    primes = _small_primes()
+    primes = primes[1:bisect_left(primes, 65536)]
+    if start <= 2:
+        yield 2
+        start = 3
+    start |= 1
+    while True:
+        sieve = bytearray([1]) * window
+        end = start + 2 * window
+        for p in primes:
+            if p * p >= end and p >= end:
+                break
+            i = ((-start) % p) * ((p + 1) // 2) % p
+            sieve[i::p] = bytes(len(range(i, window, p)))
+            if start + 2 * i == p:
+                sieve[i] = 1
+        i = sieve.find(1)
+        while i != -1:
+            yield start + 2 * i
+            i = sieve.find(1, i + 1)
+        start = end
+
+
 def floor(n: float) -> int:
     """
     calculate the largest integer <= n
@@ -62,17 +377,45 @@ def ceil(n: float) -> int:
         return int(n + 1.0)
 
 
+_MATH_GCD = None
+
+
+def _math_gcd():
+    # math.gcd is imported once, importing it on every call would take longer than the gcd of small integers
+    global _MATH_GCD
+    from math import gcd as math_gcd
+    _MATH_GCD = math_gcd
+    return math_gcd
+
+
 def gcd(a: int, b: int) -> int:
     """
-    calculate the greatest common divisor of a and b
+    calculate the greatest common divisor of a and b (math.gcd: euclid's and lehmer's algorithm in C)
 
     :param a: any integer
     :param b: any integer
-    :return: the greatest common divisor
+    :return: the greatest common divisor (>= 0)
     """
-    if b == 0:
-        return a
-    return gcd(b, a % b)
+    return (_MATH_GCD or _math_gcd())(a, b)
+
+
+def xgcd(a: int, b: int) -> (int, int, int):
+    """
+    calculate the greatest common divisor of a and b and the coefficients of bezout's identity
+
+    :param a: any integer
+    :param b: any integer
+    :return: (g, x, y) with a * x + b * y = g = gcd(a, b)
+    """
+    x0, x1, y0, y1 = 1, 0, 0, 1
+    while b:
+        q, r = divmod(a, b)
+        a, b = b, r
+        x0, x1 = x1, x0 - q * x1
+        y0, y1 = y1, y0 - q * y1
+    if a < 0:
+        return -a, -x0, -y0
+    return a, x0, y0
 
 
 def lcm(a: int, b: int) -> int:
@@ -81,110 +424,537 @@ def lcm(a: int, b: int) -> int:
 
     :param a: any integer
     :param b: any integer
-    :return: the least common multiple
+    :return: the least common multiple (>= 0)
+    """
+    if a == 0 or b == 0:
+        return 0
+    return abs(a // gcd(a, b) * b)
+
+
+def gcd_many(numbers) -> int:
+    """
+    calculate the greatest common divisor of many integers
+
+    :param numbers: any iterable of integers
+    :return: the greatest common divisor (0 if there are no numbers)
+    """
+    r = 0
+    for i in numbers:
+        r = gcd(r, i)
+        if r == 1:
+            break
+    return r
+
+
+def lcm_many(numbers) -> int:
+    """
+    calculate the least common multiple of many integers
+
+    :param numbers: any iterable of integers
+    :return: the least common multiple (1 if there are no numbers)
+    """
+    r = 1
+    for i in numbers:
+        r = lcm(r, i)
+        if r == 0:
+            break
+    return r
+
+
+def mod_inverse(a: int, n: int) -> int:
+    """
+    calculate the modular multiplicative inverse
+
+    :param a: any integer
+    :param n: the modulus (> 0)
+    :return: x with a * x = 1 (mod n)
+    """
+    try:
+        return pow(a, -1, n)
+    except ValueError:
+        # not invertible (or python < 3.8, which doesn't support negative exponents in pow)
+        g, x, _ = xgcd(a % n, n)
+        if g != 1:
+            raise ValueError(str(a) + ' is not invertible modulo ' + str(n))
+        return x % n
+
+
+def batch_inverse(values: list, n: int) -> list:
+    """
+    calculate the modular inverses of many integers with only one inversion (montgomery's trick)
+
+    :param values: the integers (all of them have to be invertible)
+    :param n: the modulus (> 0)
+    :return: the inverses (same order)
+    """
+    values = [i % n for i in values]
+    if not values:
+        return []
+    prefix = [values[0]]
+    for i in values[1:]:
+        prefix.append(prefix[-1] * i % n)
+    x = mod_inverse(prefix[-1], n)
+    r = [0] * len(values)
+    for i in range(len(values) - 1, 0, -1):
+        r[i] = x * prefix[i - 1] % n
+        x = x * values[i] % n
+    r[0] = x
+    return r
+
+
+def crt(residues: list, moduli: list) -> (int, int):
+    """
+    solve a system of congruences x = residues[i] (mod moduli[i]) (chinese remainder theorem),
+    the moduli don't have to be coprime
+
+    :param residues: the remainders
+    :param moduli: the moduli (> 0)
+    :return: (x, m): all solutions are x + k * m (ValueError if there is no solution)
+    """
+    x, m = 0, 1
+    for r, n in zip(residues, moduli):
+        g, u, _ = xgcd(m, n)
+        if (r - x) % g != 0:
+            raise ValueError('There is no solution')
+        x += m * ((r - x) // g * u % (n // g))
+        m = m // g * n
+        x %= m
+    return x, m
+
+
+class CRT:
+    """
+    The chinese remainder theorem for fixed pairwise coprime moduli,
+    the inverses are calculated once, so that combine is cheap (garner's algorithm)
+    """
+
+    def __init__(self, moduli: list, inverses: list = None) -> None:
+        """
+        :param moduli: pairwise coprime moduli
+        :param inverses: Optional: inverses[i - 1] = (moduli[0] * ... * moduli[i - 1])^-1 mod moduli[i]
+        """
+        self.moduli = list(moduli)
+        self.modulus = 1
+        prefix = []
+        for i in self.moduli:
+            prefix.append(self.modulus)
+            self.modulus *= i
+        if inverses is None:
+            inverses = [mod_inverse(prefix[i], self.moduli[i]) for i in range(1, len(self.moduli))]
+        self.inverses = list(inverses)
+        self._prefix = prefix
+
+    def combine(self, residues: list) -> int:
+        """
+        find the solution of x = residues[i] (mod moduli[i])
+
+        :param residues: the remainders
+        :return: x (0 <= x < the product of the moduli)
+        """
+        x = residues[0] % self.moduli[0]
+        for i in range(1, len(self.moduli)):
+            x += (residues[i] - x) * self.inverses[i - 1] % self.moduli[i] * self._prefix[i]
+        return x
+
+
+class Modulus:
+    """
+    A context for arithmetic modulo a fixed n, which caches precomputations (inverses and tables for fixed bases)
+    """
+
+    def __init__(self, n: int) -> None:
+        """
+        :param n: the modulus (> 1)
+        """
+        if n < 2:
+            raise ValueError('The modulus has to be bigger than 1')
+        self.n = n
+        self._tables = {}
+        self._inverses = {}
+
+    def fixed_base(self, base: int, window: int = 4, bits: int = None) -> None:
+        """
+        precompute a table for a base which is raised to many different exponents (pow becomes several times faster)
+
+        :param base: the base
+        :param window: number of bits per table row (memory: 2^window numbers per row)
+        :param bits: the maximum length of the exponents (default: the length of n)
+        """
+        base %= self.n
+        key = base
+        bits = self.n.bit_length() if bits is None else bits
+        table = []
+        for _ in range((bits + window - 1) // window):
+            row = [1, base]
+            for _ in range(2, pow(2, window)):
+                row.append(row[-1] * base % self.n)
+            table.append(row)
+            base = row[-1] * base % self.n
+        self._tables[key] = (window, table)
+
+    def pow(self, base: int, exponent: int) -> int:
+        """
+        calculate base^exponent mod n (uses the table of fixed_base if there is one)
+
+        :param base: the base
+        :param exponent: the exponent (negative exponents use the inverse)
+        :return: the result
+        """
+        base %= self.n
+        if exponent < 0:
+            return self.pow(self.inverse(base), -exponent)
+        t = self._tables.get(base)
+        if t is None or exponent.bit_length() > len(t[1]) * t[0]:
+            return pow(base, exponent, self.n)
+        window, table = t
+        mask = pow(2, window) - 1
+        r = 1
+        i = 0
+        while exponent:
+            if exponent & mask:
+                r = r * table[i][exponent & mask] % self.n
+            exponent >>= window
+            i += 1
+        return r % self.n
+
+    def inverse(self, a: int) -> int:
+        """
+        calculate the modular inverse (cached)
+
+        :param a: any integer coprime to n
+        :return: a^-1 mod n
+        """
+        a %= self.n
+        if a not in self._inverses:
+            if len(self._inverses) >= 256:
+                del self._inverses[next(iter(self._inverses))]
+            self._inverses[a] = mod_inverse(a, self.n)
+        return self._inverses[a]
+
+    def batch_inverse(self, values: list) -> list:
+        """
+        calculate the inverses of many integers with only one inversion (see batch_inverse)
+
+        :param values: integers coprime to n
+        :return: the inverses (same order)
+        """
+        return batch_inverse(values, self.n)
+
+
+_MODULI = {}
+
+MODULUS_CACHE_SIZE = 32
+
+
+def modulus(n: int) -> Modulus:
+    """
+    get the shared context of a modulus (the last MODULUS_CACHE_SIZE contexts are kept)
+
+    :param n: the modulus (> 1)
+    :return: the Modulus
+    """
+    if n not in _MODULI:
+        while len(_MODULI) >= MODULUS_CACHE_SIZE:
+            del _MODULI[next(iter(_MODULI))]
+        _MODULI[n] = Modulus(n)
+    return _MODULI[n]
+
+
+_NUMPY = None
+XOR_NUMPY_THRESHOLD = 1024
+
+
+def _numpy():
+    """
+    import numpy if it is installed (only tried once)
+
+    :return: the numpy module or False
     """
-    return a * b // gcd(a, b)
+    global _NUMPY
+    if _NUMPY is None:
+        try:
+            import numpy
+            _NUMPY = numpy
+        except (ImportError, ModuleNotFoundError):
+            _NUMPY = False
+    return _NUMPY
 
 
 def bytes_xor(a: bytes, b: bytes, short: bool = False) -> bytes:
+    """
+    xor two bytes objects (or any other buffers); numpy is used for large buffers if it is installed
+
+    :param a: the first bytes
+    :param b: the second bytes
+    :param short: allow different lengths (the result has the length of the shorter one)
+    :return: a ^ b
+    """
+    a = memoryview(a).cast('B')
+    b = memoryview(b).cast('B')
     if short:
-        return bytes(x ^ y for x, y in zip(a, b))
+        size = min(len(a), len(b))
+        a = a[:size]
+        b = b[:size]
     elif len(a) != len(b):
         raise ValueError('both bytes objects must have the same length')
     else:
-        return bytes(x ^ y for x, y in zip(a, b))
+        size = len(a)
+    if size >= XOR_NUMPY_THRESHOLD and _numpy():
+        np = _numpy()
+        return np.bitwise_xor(np.frombuffer(a, np.uint8), np.frombuffer(b, np.uint8)).tobytes()
+    return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(size, 'little')
+
 
+def bytes_xor_into(target, b: bytes) -> None:
+    """
+    xor a writable buffer with another buffer in place (target ^= b)
 
-def bytes_to_int(n: bytes) -> int:
+    :param target: a bytearray or a writable memoryview
+    :param b: the other bytes (same length as target)
+    """
+    t = memoryview(target).cast('B')
+    b = memoryview(b).cast('B')
+    if len(t) != len(b):
+        raise ValueError('both bytes objects must have the same length')
+    if len(t) >= XOR_NUMPY_THRESHOLD and _numpy():
+        np = _numpy()
+        x = np.frombuffer(t, np.uint8)
+        np.bitwise_xor(x, np.frombuffer(b, np.uint8), out=x)
+    else:
+        t[:] = (int.from_bytes(t, 'little') ^ int.from_bytes(b, 'little')).to_bytes(len(t), 'little')
+
+
+def bytes_xor_repeat(data: bytes, key: bytes) -> bytes:
+    """
+    xor bytes with a key which is repeated to the length of the data
+
+    :param data: the bytes
+    :param key: the key (not empty)
+    :return: the result (same length as data)
+    """
+    data = memoryview(data).cast('B')
+    key = bytes(key)
+    if not key:
+        raise ValueError('The key may not be empty')
+    return bytes_xor(data, (key * (len(data) // len(key) + 1))[:len(data)])
+
+
+def bytes_to_int(n: bytes, byteorder: str = 'big', signed: bool = False) -> int:
     """
     turn bytes into an integer
 
-    :param n: the bytes
+    :param n: the bytes (or any other buffer)
+    :param byteorder: 'big' or 'little'
+    :param signed: two's complement is used to represent negative integers
     :return: the integer
     """
-    r = 0
-    for p in n:
-        r *= 256
-        r += p
-    return r
+    return int.from_bytes(n, byteorder, signed=signed)
 
 
-def int_to_bytes(n: int) -> bytes:
+def int_to_bytes(n: int, length: int = None, byteorder: str = 'big', signed: bool = False, padding: int = 1) -> bytes:
     """
     turn an integer into bytes
 
     :param n: the integer
+    :param length: the number of bytes (padded with zeros; OverflowError if n is too big),
+                   None = as short as possible (0 -> b'')
+    :param byteorder: 'big' or 'little'
+    :param signed: two's complement is used to represent negative integers
+    :param padding: without length, the length is rounded up to a multiple of padding
     :return: the bytes
     """
-    r = b''
-    x = n
-    while x > 0:
-        r = bytes([x % 256]) + r
-        x //= 256
-    return r
+    if length is None:
+        if signed:
+            length = ((n if n >= 0 else ~n).bit_length() + 8) // 8
+        else:
+            length = (n.bit_length() + 7) // 8
+        if length % padding != 0:
+            length += padding - length % padding
+    return n.to_bytes(length, byteorder, signed=signed)
 
 
-def float_to_fraction(n: float, use_brute_force: bool = True, disable_gcd: bool = False, max_iterations: int = 16777215) -> (int, int):
+def _array_typecode(width: int, signed: bool) -> str:
     """
-    turn a number into a fraction (numerator, denominator)
+    find the typecode of array.array for integers with a specified number of bytes
+
+    :param width: the number of bytes
+    :param signed: signed or unsigned integers
+    :return: the typecode (None if there is none)
+    """
+    from array import array
+    for i in ('bhilq' if signed else 'BHILQ'):
+        if array(i).itemsize == width:
+            return i
+    return None
+
+
+def bytes_to_ints(data: bytes, width: int, byteorder: str = 'big', signed: bool = False) -> list:
+    """
+    turn a buffer of integers with a fixed width into a list of integers
+
+    :param data: the bytes (or any other buffer)
+    :param width: the number of bytes of each integer
+    :param byteorder: 'big' or 'little'
+    :param signed: two's complement is used to represent negative integers
+    :return: the integers
+    """
+    from array import array
+    from sys import byteorder as native
+    m = memoryview(data).cast('B')
+    if len(m) % width != 0:
+        raise ValueError('The length of data has to be a multiple of width')
+    code = _array_typecode(width, signed)
+    if code is not None:
+        r = array(code, m.tobytes())
+        if byteorder != native and width > 1:
+            r.byteswap()
+        return r.tolist()
+    return [int.from_bytes(m[i:i + width], byteorder, signed=signed) for i in range(0, len(m), width)]
+
+
+def ints_to_bytes(numbers, width: int, byteorder: str = 'big', signed: bool = False) -> bytes:
+    """
+    turn integers into one bytes object, each integer with a fixed width
+
+    :param numbers: the integers (any iterable)
+    :param width: the number of bytes of each integer (OverflowError if an integer is too big)
+    :param byteorder: 'big' or 'little'
+    :param signed: two's complement is used to represent negative integers
+    :return: the bytes
+    """
+    from array import array
+    from sys import byteorder as native
+    code = _array_typecode(width, signed)
+    if code is not None:
+        r = array(code, numbers)
+        if byteorder != native and width > 1:
+            r.byteswap()
+        return r.tobytes()
+    return b''.join(i.to_bytes(width, byteorder, signed=signed) for i in numbers)
+
+
+def _simplest_fraction(a: int, b: int, x: float) -> (int, int):
+    """
+    find the fraction with the smallest denominator which rounds to the float x,
+    by walking through the convergents and semiconvergents of a/b (the exact value of x)
+
+    :param a: numerator of x (> 0)
+    :param b: denominator of x (> 0)
+    :param x: the float
+    :return: the fraction (numerator, denominator)
+    """
+    p0, q0, p1, q1 = 0, 1, 1, 0
+    n, d = a, b
+    while d:
+        t = n // d
+        if (p0 + t * p1) / (q0 + t * q1) == x:
+            # the semiconvergents approach a/b monotonically, so the first one which rounds to x can be bisected
+            low, high = 1, t
+            while low < high:
+                k = (low + high) // 2
+                if (p0 + k * p1) / (q0 + k * q1) == x:
+                    high = k
+                else:
+                    low = k + 1
+            return p0 + low * p1, q0 + low * q1
+        p0, q0, p1, q1 = p1, q1, p0 + t * p1, q0 + t * q1
+        n, d = d, n - t * d
+    return p1, q1
+
+
+def _limit_denominator(a: int, b: int, max_denominator: int) -> (int, int):
+    """
+    find the closest fraction to a/b with a bounded denominator (continued fractions)
+
+    :param a: numerator (>= 0)
+    :param b: denominator (> 0)
+    :param max_denominator: the maximum denominator (>= 1)
+    :return: the fraction (numerator, denominator)
+    """
+    if b <= max_denominator:
+        return a, b
+    p0, q0, p1, q1 = 0, 1, 1, 0
+    n, d = a, b
+    while True:
+        t = n // d
+        q2 = q0 + t * q1
+        if q2 > max_denominator:
+            break
+        p0, q0, p1, q1 = p1, q1, p0 + t * p1, q2
+        n, d = d, n - t * d
+    k = (max_denominator - q0) // q1
+    p2, q2 = p0 + k * p1, q0 + k * q1
+    # choose the closer one of the two bounds: |p1/q1 - a/b| <= |p2/q2 - a/b|
+    if abs(p1 * b - a * q1) * q2 <= abs(p2 * b - a * q2) * q1:
+        return p1, q1
+    return p2, q2
+
+
+def float_to_fraction(n: float, use_brute_force: bool = True, disable_gcd: bool = False, max_iterations: int = None,
+                      max_denominator: int = None, exact: bool = False) -> (int, int):
+    """
+    turn a number into a fraction (numerator, denominator); by default the fraction with the smallest denominator
+    which rounds to n (for example 0.1 -> (1, 10), 1/3 -> (1, 3))
 
     :param n: any number
-    :param use_brute_force: get expected result for rational numbers
-    :param disable_gcd: save resources, doesn't affect brute force method
-    :param max_iterations: maximum guesses using brute force
+    :param use_brute_force: False = the fraction of the shortest decimal representation of n
+                            (for example 1/3 -> (3333333333333333, 10000000000000000))
+    :param disable_gcd: don't reduce the fraction of the decimal representation
+    :param max_iterations: kept for compatibility, the result doesn't depend on it
+    :param max_denominator: the closest fraction with a denominator <= max_denominator
+    :param exact: the exact value of the float (the denominator is a power of 2)
     :return: the fraction (numerator, denominator)
     """
-    if use_brute_force:
-        if n == 1/1:
-            return 1, 1
-        elif n == 0/1:
-            return 0, 1
+    n = float(n)
+    if n != n or n in (float('inf'), float('-inf')):
+        raise ValueError(str(n) + ' is not a finite number')
+    if n < 0:
+        a, b = float_to_fraction(-n, use_brute_force, disable_gcd, max_iterations, max_denominator, exact)
+        return -a, b
+    a, b = n.as_integer_ratio()
+    if exact or a == 0:
+        return a, b
+    if max_denominator is not None:
+        if max_denominator < 1:
+            raise ValueError('max_denominator has to be at least 1')
+        return _limit_denominator(a, b, max_denominator)
+    if not use_brute_force:
+        x = repr(n).split('e')
+        digits = x[0].split('.')
+        exponent = (int(x[1]) if len(x) > 1 else 0) - (len(digits[1]) if len(digits) > 1 else 0)
+        a = int(''.join(digits))
+        b = 1
+        if exponent >= 0:
+            a *= pow(10, exponent)
         else:
-            x = 1
-            y = 1
-            z = 0
-            for _ in range(max_iterations):
-                if y == 1 and z == 3:
-                    z = 0
-                    x += 1
-                elif z == 0:
-                    z = 1
-                    y += 1
-                elif x == 1 and z == 1:
-                    z = 2
-                    y += 1
-                elif z == 2:
-                    z = 3
-                    x += 1
-                elif z == 1:
-                    y += 1
-                    x -= 1
-                elif z == 3:
-                    y -= 1
-                    x += 1
-                else:
-                    raise Exception()
-                if n == x / y:
-                    return x, y
-            print(x, y)
-            c = str(n).split('.')
-            y = len(c[1])
-            a = int(c[0]) * pow(10, y) + int(c[1])
-            b = pow(10, y)
+            b = pow(10, -exponent)
+        if not disable_gcd:
             z = gcd(a, b)
             a //= z
             b //= z
-            return a, b
-    else:
-        c = str(n).split('.')
-        y = len(c[1])
-        a = int(c[0]) * pow(10, y) + int(c[1])
-        b = pow(10, y)
-    if not disable_gcd:
-        z = gcd(a, b)
-        a //= z
-        b //= z
-    return a, b
+        return a, b
+    return _simplest_fraction(a, b, n)
+
+
+def floats_to_fractions(values, max_denominator: int = None, exact: bool = False) -> list:
+    """
+    turn many numbers into fractions (see float_to_fraction), repeated values are only converted once
+
+    :param values: any iterable of numbers (for example a list or a numpy array)
+    :param max_denominator: the closest fractions with a denominator <= max_denominator
+    :param exact: the exact values of the floats
+    :return: the fractions [(numerator, denominator), ...]
+    """
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    cache = {}
+    r = []
+    for i in values:
+        i = float(i)
+        if i not in cache:
+            cache[i] = float_to_fraction(i, max_denominator=max_denominator, exact=exact)
+        r.append(cache[i])
+    return r
 
 
 def next_prime(n: int, max_guess: int = 65536, allow_same: bool = False) -> int:
@@ -201,128 +971,417 @@ def next_prime(n: int, max_guess: int = 65536, allow_same: bool = False) -> int:
             return n
     if n < 2:
         return 2
-    if n % 2 == 0:
-        n += 1
-    else:
-        n += 2
-    for i in range(0, max_guess, 2):
-        if miller_prime(n + i):
-            return n + i
+    for i in prime_candidates(n + 1):
+        if i > n + max_guess:
+            break
+        if miller_prime(i):
+            return i
     raise InterruptedError('Maximum guesses reached')
 
 
+def isqrt(n: int) -> int:
+    """
+    get the square root (or the biggest integer smaller than it) of any non-negative integer (newton's method)
+
+    :param n: any non-negative integer
+    :return: the integer square root
+    """
+    return iroot(n, 2)
+
+
+def iroot(n: int, k: int) -> int:
+    """
+    get the k-th root (or the biggest integer smaller than it) of any non-negative integer (newton's method),
+    exact for integers of any size
+
+    :param n: any non-negative integer
+    :param k: the degree of the root (k >= 1)
+    :return: the integer k-th root
+    """
+    if n < 0:
+        raise ValueError('n has to be non-negative')
+    if k < 1:
+        raise ValueError('k has to be positive')
+    if n < 2 or k == 1:
+        return n
+    bits = n.bit_length()
+    if bits <= k:
+        return 1
+    # a float estimate of the leading bits, made slightly too big, so that newton's method decreases monotonically
+    shift = max(0, (bits - 960 + k - 1) // k * k)
+    x = (int((n >> shift) ** (1 / k) * 1.000000001) + 1) << (shift // k)
+    while True:
+        y = ((k - 1) * x + n // pow(x, k - 1)) // k
+        if y >= x:
+            return x
+        x = y
+
+
+def perfect_power(n: int) -> (int, int):
+    """
+    find the smallest base b with b^e = n
+
+    :param n: any integer > 1
+    :return: (b, e); e = 1 if n isn't a perfect power
+    """
+    if n < 2:
+        raise ValueError('n has to be bigger than 1')
+    for k in primes_in_range(2, n.bit_length() + 1):
+        x = iroot(n, k)
+        if pow(x, k) == n:
+            b, e = perfect_power(x) if x > 1 else (x, 1)
+            return b, e * k
+    return n, 1
+
+
+def sqrt_fraction(x: int, y: int, bits: int = 64) -> (int, int):
+    """
+    calculate the square root of a fraction with a specified precision (exact if x/y is a square)
+
+    :param x: numerator (>= 0)
+    :param y: denominator (> 0)
+    :param bits: the error is smaller than 2^-bits
+    :return: the square root (numerator, denominator)
+    """
+    if x < 0 or y <= 0:
+        raise ValueError('x/y has to be non-negative')
+    z = gcd(x, y)
+    x //= z
+    y //= z
+    a = isqrt(x)
+    b = isqrt(y)
+    if a * a == x and b * b == y:
+        return a, b
+    a = isqrt((x << (2 * bits)) // y)
+    b = pow(2, bits)
+    z = gcd(a, b)
+    return a // z, b // z
+
+
 def sqrt(n: float, depth: int = None) -> float:
     """
-    calculate an approximation to the square root of any number
+    calculate the square root of any non-negative number (correctly rounded)
 
-    :param n: any number
-    :param depth: higher values -> higher accuracy -> more resource usage;
-                  lower values -> lower accuracy -> less resource usage
-                  None = automatic
+    :param n: any non-negative number
+    :param depth: kept for compatibility, the result doesn't depend on it
     :return: the square root
     """
-    a = 1.0
-    b = n
-    if depth is None:
-        while True:
-            a = (a + b) / 2
-            b = n / a
-            if abs(a - b) < 0.000244140625:
-                return b
-    for i in range(depth):
-        a = (a + b) / 2
-        b = n / a
-    return b
+    if n < 0:
+        raise ValueError('n has to be non-negative')
+    if n == 0:
+        return 0.0
+    x, y = float(n).as_integer_ratio()
+    # 1100 bits are enough for the correct rounding of every float (also subnormal ones)
+    a, b = sqrt_fraction(x, y, 1100)
+    return a / b
 
 
-def sqrt_q(x, y, depth: int = None) -> (int, int):
+def sqrt_q(x, y, depth: int = None, bits: int = None) -> (int, int):
     """
-    calculate an approximation to the square root of a fraction
+    calculate an approximation to the square root of a fraction (see sqrt_fraction)
 
     :param x: numerator
     :param y: denominator
-    :param depth: higher values -> higher accuracy -> more resource usage;
-                  lower values -> lower accuracy -> less resource usage
-                  None = automatic
+    :param depth: kept for compatibility: each step of the old method doubled the precision, so bits = 2^depth
+    :param bits: the error is smaller than 2^-bits (default: 64)
     :return: the square root (numerator, denominator)
     """
-    a, b = 1, 1
-    c, d = x, y
-    if depth is None:
-        while True:
-            a = a * d + c * b
-            b = b * d * 2
-            c = b * x
-            d = a * y
-            if abs(a / b - c / d) < 0.000244140625:
-                z = gcd(c, d)
-                return c // z, d // z
-    for i in range(depth):
-        a = a * d + c * b
-        b = b * d * 2
-        c = b * x
-        d = a * y
-    z = gcd(c, d)
-    return c // z, d // z
+    if bits is None:
+        bits = 64 if depth is None else pow(2, depth)
+    return sqrt_fraction(x, y, bits)
 
 
 def sqrt_n(n: int) -> int:
     """
-    get the square root (or the biggest integer smaller than it) of any integer
+    get the square root (or the biggest integer smaller than it) of any non-negative integer
 
-    :param n: any integer
-    :return:
+    :param n: any non-negative integer
+    :return: the integer square root
     """
-    if n == 0:
-        return 0
-    if n == 1:
-        return 1
-    for i in range(n):
-        if pow(i, 2) > n:
-            return i - 1
+    return isqrt(n)
 
 
 def is_prime(n: int) -> bool:
     """
-    check if an integer is a prime
+    check if an integer is a prime (see is_probable_prime)
 
     :param n: any integer
     :return: True (is a prime) or False (is NOT a prime)
     """
-    if n < 2:
-        return False
-    if n in [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47]:
-        return True
-    if n % 2 == 0:
-        return False
-    for i in range(3, sqrt_n(n) + 2, 2):
-        if n % i == 0 and i < n:
-            return False
-    return True
+    return is_probable_prime(n)
+
+
+class Rational:
+    """
+    An immutable fraction with operators (+ - * / ** == < hash ...)
+    It is only reduced when it is needed and the reduced form is cached,
+    the results of operations with reduced fractions are calculated with small gcds and are always reduced
+    """
+
+    __slots__ = ('_n', '_d', '_reduced')
+
+    def __new__(cls, numerator=0, denominator: int = 1):
+        """
+        :param numerator: an integer, a float or a Rational
+        :param denominator: an integer (not 0)
+        """
+        if isinstance(numerator, Rational):
+            if denominator == 1:
+                return numerator
+            return numerator / denominator
+        if isinstance(numerator, float):
+            numerator, d = float_to_fraction(numerator)
+            return cls._new(numerator, d, True) if denominator == 1 else cls._new(numerator, d, True) / denominator
+        if not isinstance(numerator, int) or not isinstance(denominator, int):
+            raise TypeError('Only integers, floats and Rationals are supported')
+        if denominator == 0:
+            raise ZeroDivisionError('The denominator may not be 0')
+        if denominator < 0:
+            numerator, denominator = -numerator, -denominator
+        return cls._new(numerator, denominator, denominator == 1)
+
+    @classmethod
+    def _new(cls, numerator: int, denominator: int, reduced: bool):
+        # without any checks: the denominator has to be positive
+        obj = object.__new__(cls)
+        obj._n = numerator
+        obj._d = denominator
+        obj._reduced = reduced
+        return obj
+
+    def _reduce(self) -> None:
+        # the value never changes, only its representation
+        if not self._reduced:
+            x = gcd(self._n, self._d)
+            self._n //= x
+            self._d //= x
+            self._reduced = True
+
+    @property
+    def numerator(self) -> int:
+        self._reduce()
+        return self._n
+
+    @property
+    def denominator(self) -> int:
+        self._reduce()
+        return self._d
+
+    def __reduce__(self):
+        return self.__class__, (self.numerator, self.denominator)
+
+    @staticmethod
+    def _convert(other):
+        # int -> (n, 1), Rational or numbers.Rational (e.g. fractions.Fraction) -> reduced (n, d), anything else -> None
+        if isinstance(other, int):
+            return other, 1
+        if isinstance(other, Rational):
+            other._reduce()
+            return other._n, other._d
+        from numbers import Rational as RationalNumber
+        if isinstance(other, RationalNumber):
+            return other.numerator, other.denominator
+        return None
+
+    def __add__(self, other):
+        if isinstance(other, float):
+            return float(self) + other
+        o = self._convert(other)
+        if o is None:
+            return NotImplemented
+        self._reduce()
+        a, b = self._n, self._d
+        c, d = o
+        if d == 1:
+            return Rational._new(a + c * b, b, True)
+        g = gcd(b, d)
+        if g == 1:
+            return Rational._new(a * d + b * c, b * d, True)
+        s = b // g
+        t = a * (d // g) + c * s
+        g2 = gcd(t, g)
+        return Rational._new(t // g2, s * (d // g2), True)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return Rational._new(-self._n, self._d, self._reduced)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Rational._new(abs(self._n), self._d, self._reduced)
+
+    def __sub__(self, other):
+        if isinstance(other, float):
+            return float(self) - other
+        o = self._convert(other)
+        if o is None:
+            return NotImplemented
+        return self + Rational._new(-o[0], o[1], True)
+
+    def __rsub__(self, other):
+        if isinstance(other, float):
+            return other - float(self)
+        o = self._convert(other)
+        if o is None:
+            return NotImplemented
+        return -self + Rational._new(o[0], o[1], True)
+
+    def __mul__(self, other):
+        if isinstance(other, float):
+            return float(self) * other
+        o = self._convert(other)
+        if o is None:
+            return NotImplemented
+        self._reduce()
+        a, b = self._n, self._d
+        c, d = o
+        g1 = gcd(a, d)
+        g2 = gcd(c, b)
+        return Rational._new((a // g1) * (c // g2), (b // g2) * (d // g1), True)
+
+    __rmul__ = __mul__
+
+    def _inverse(self):
+        self._reduce()
+        if self._n == 0:
+            raise ZeroDivisionError('It is impossible to divide by zero')
+        if self._n < 0:
+            return Rational._new(-self._d, -self._n, True)
+        return Rational._new(self._d, self._n, True)
+
+    def __truediv__(self, other):
+        if isinstance(other, float):
+            return float(self) / other
+        o = self._convert(other)
+        if o is None:
+            return NotImplemented
+        return self * Rational._new(o[0], o[1], True)._inverse()
+
+    def __rtruediv__(self, other):
+        if isinstance(other, float):
+            return other / float(self)
+        o = self._convert(other)
+        if o is None:
+            return NotImplemented
+        return self._inverse() * Rational._new(o[0], o[1], True)
+
+    def __pow__(self, other):
+        if isinstance(other, Rational) and other.denominator == 1:
+            other = other.numerator
+        if isinstance(other, int):
+            self._reduce()
+            if other >= 0:
+                return Rational._new(pow(self._n, other), pow(self._d, other), True)
+            return self._inverse() ** -other
+        if isinstance(other, (float, Rational)):
+            return float(self) ** float(other)
+        return NotImplemented
+
+    def __rpow__(self, other):
+        if self.denominator == 1:
+            return other ** self.numerator
+        return other ** float(self)
+
+    def _compare(self, other):
+        # the sign of self - other (None if other isn't a number)
+        if isinstance(other, float):
+            if other != other or other in (float('inf'), float('-inf')):
+                return None if other != other else (-1 if other > 0 else 1)
+            other = other.as_integer_ratio()
+        else:
+            other = self._convert(other)
+            if other is None:
+                return None
+        x = self._n * other[1] - other[0] * self._d
+        return (x > 0) - (x < 0)
+
+    def __eq__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c == 0
+
+    def __lt__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c < 0
+
+    def __le__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c <= 0
+
+    def __gt__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c > 0
+
+    def __ge__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c >= 0
+
+    def __hash__(self):
+        # the same hash as int, float and fractions.Fraction with the same value
+        from sys import hash_info
+        self._reduce()
+        x = pow(self._d, hash_info.modulus - 2, hash_info.modulus)
+        if x == 0:
+            h = hash_info.inf
+        else:
+            h = abs(self._n) % hash_info.modulus * x % hash_info.modulus
+        h = h if self._n >= 0 else -h
+        return -2 if h == -1 else h
+
+    def __bool__(self):
+        return self._n != 0
+
+    def __float__(self):
+        return self._n / self._d
+
+    def __int__(self):
+        return -(-self._n // self._d) if self._n < 0 else self._n // self._d
+
+    def __floor__(self):
+        return self._n // self._d
+
+    def __repr__(self):
+        return 'Rational(' + str(self.numerator) + ', ' + str(self.denominator) + ')'
+
+    def __str__(self):
+        if self.denominator == 1:
+            return str(self._n)
+        return str(self._n) + '/' + str(self._d)
 
 
 class Q:
     """
-    A class for fractions
+    A class for fractions (mutable, see Rational for an immutable fraction with operators)
     """
 
+    __slots__ = ('value',)
+
     def __init__(self, n=None) -> None:
         if n is None:
-            self.numerator = 0
-            self.denominator = 1
-        elif isinstance(n, float):
-            x = str(n).split('.')
-            y = len(x[1])
-            self.numerator = int(x[0]) * pow(10, y) + int(x[1])
-            self.denominator = pow(10, y)
-            self._reduce()
-        elif isinstance(n, int):
-            self.numerator = n
-            self.denominator = 1
-            self._reduce()
+            self.value = Rational._new(0, 1, True)
+        elif isinstance(n, (float, int, Rational)):
+            self.value = Rational(n)
         else:
             raise TypeError(str(type(n)) + ' is not supported')
 
+    @property
+    def numerator(self) -> int:
+        return self.value.numerator
+
+    @numerator.setter
+    def numerator(self, n: int) -> None:
+        self.value = Rational(n, self.value.denominator)
+
+    @property
+    def denominator(self) -> int:
+        return self.value.denominator
+
+    @denominator.setter
+    def denominator(self, n: int) -> None:
+        self.value = Rational(self.value.numerator, n)
+
     def get(self) -> (int, int):
         return self.numerator, self.denominator
 
@@ -330,70 +1389,283 @@ class Q:
         return self.numerator // self.denominator
 
     def get_float(self) -> float:
-        return self.numerator / self.denominator
+        return float(self.value)
 
     def _reduce(self) -> None:
-        x = gcd(self.denominator, self.numerator)
-        self.denominator //= x
-        self.numerator //= x
+        self.value._reduce()
 
     def set_int(self, n: int) -> None:
-        self.numerator = n
-        self.denominator = 1
-        self._reduce()
+        self.value = Rational(n)
 
     def set_float(self, n: float) -> None:
-        x = str(n).split('.')
-        y = len(x[1])
-        self.numerator = int(x[0]) * pow(10, y) + int(x[1])
-        self.denominator = pow(10, y)
-        self._reduce()
+        self.value = Rational(float(n))
 
     def set(self, numerator: int, denominator: int = 1) -> None:
         if denominator == 0:
             raise ZeroDivisionError('[ It is impossible to divide by zero. If you could, you could proof that 1 = 2:\n'
                                     'a = b\na² = ab\na²-b² = ab-b²\n(a+b)(a-b) = b(a-b)\na+b = b\n2b = b\n2 = 1 ]')
         else:
-            self.numerator = numerator
-            self.denominator = denominator
-            self._reduce()
+            self.value = Rational(numerator, denominator)
 
     def add(self, n: int) -> None:
-        self.numerator += n * self.denominator
-        self._reduce()
+        self.value += n
 
     def subtract(self, n: int) -> None:
-        self.numerator -= n * self.denominator
-        self._reduce()
+        self.value -= n
 
     def multiply(self, n: int) -> None:
-        self.numerator *= n
-        self._reduce()
+        self.value *= n
 
     def divide(self, n: int) -> None:
-        self.denominator *= n
-        self._reduce()
+        self.value /= n
 
     def add_fraction(self, a, b) -> None:
-        x = lcm(self.denominator, b)
-        self.numerator *= x // self.denominator
-        self.denominator = x
-        self.numerator += a * x
-        self._reduce()
+        self.value += Rational(a, b)
 
     def subtract_fraction(self, a, b) -> None:
-        x = lcm(self.denominator, b)
-        self.numerator *= x // self.denominator
-        self.denominator = x
-        self.numerator -= a * x
-        self._reduce()
+        self.value -= Rational(a, b)
 
     def multiply_fraction(self, a, b):
-        self.numerator *= a
-        self.denominator *= b
-        self._reduce()
+        self.value *= Rational(a, b)
 
     def divide_fraction(self, a, b):
-        self.numerator *= b
-        self.denominator *= a
-        self._reduce()
+        self.value /= Rational(a, b)
+
+
+def _int_column(values):
+    """
+    store integers in an array: numpy int64 (or array('q') without numpy) if all of them fit into 64 bits,
+    otherwise numpy objects (or a list)
+
+    :param values: a list of integers, a numpy array, an array('q') or a list
+    :return: the column
+    """
+    from array import array
+    np = _numpy()
+    if np:
+        if isinstance(values, np.ndarray):
+            if values.dtype == object and len(values) and max(abs(int(values.max())), abs(int(values.min()))) < pow(2, 63):
+                return values.astype(np.int64)
+            return values
+        values = list(values)
+        if not values or max(abs(max(values)), abs(min(values))) < pow(2, 63):
+            return np.array(values, dtype=np.int64)
+        return np.array(values, dtype=object)
+    values = list(values)
+    if not values or max(abs(max(values)), abs(min(values))) < pow(2, 63):
+        return array('q', values)
+    return values
+
+
+class QArray:
+    """
+    A column of fractions: the numerators and denominators are stored in two arrays
+    (numpy int64 or array('q') without numpy; python integers if the values get too big for 64 bits)
+    all elements are always reduced and their denominators are positive
+    """
+
+    __slots__ = ('_n', '_d')
+
+    def __init__(self, values=(), denominators=None) -> None:
+        """
+        :param values: numbers (integers, floats, Rationals or Qs) or the numerators (if denominators is given)
+        :param denominators: Optional: the denominators (integers, not 0)
+        """
+        if denominators is None:
+            n = []
+            d = []
+            for i in values:
+                if isinstance(i, (Rational, Q)):
+                    n.append(i.numerator)
+                    d.append(i.denominator)
+                elif isinstance(i, float):
+                    a, b = float_to_fraction(i)
+                    n.append(a)
+                    d.append(b)
+                else:
+                    n.append(int(i))
+                    d.append(1)
+        else:
+            n = [int(i) for i in values]
+            d = [int(i) for i in denominators]
+            if len(n) != len(d):
+                raise ValueError('There have to be as many numerators as denominators')
+        self._n, self._d = self._normalize(n, d)
+
+    @staticmethod
+    def _normalize(n, d) -> tuple:
+        # reduce all fractions and make the denominators positive
+        np = _numpy()
+        if np:
+            n = _int_column(n)
+            d = _int_column(d)
+            if len(d) and not d.all():
+                raise ZeroDivisionError('The denominator may not be 0')
+            sign = np.where(d < 0, -1, 1)
+            g = np.gcd(n, d) * sign
+            return _int_column(n // g), _int_column(d // g)
+        n = list(n)
+        d = list(d)
+        if 0 in d:
+            raise ZeroDivisionError('The denominator may not be 0')
+        rn = []
+        rd = []
+        for a, b in zip(n, d):
+            g = gcd(a, b) if b > 0 else -gcd(a, b)
+            rn.append(a // g)
+            rd.append(b // g)
+        return _int_column(rn), _int_column(rd)
+
+    @classmethod
+    def _new(cls, n, d):
+        obj = object.__new__(cls)
+        obj._n, obj._d = cls._normalize(n, d)
+        return obj
+
+    @classmethod
+    def from_floats(cls, values, max_denominator: int = None):
+        """
+        turn floats into fractions (see floats_to_fractions)
+
+        :param values: any iterable of numbers (for example a list or a numpy array)
+        :param max_denominator: the closest fractions with a denominator <= max_denominator
+        :return: the QArray
+        """
+        r = floats_to_fractions(values, max_denominator)
+        return cls([i[0] for i in r], [i[1] for i in r])
+
+    def _operands(self, other) -> tuple:
+        # (a, b, c, d): the columns of self and other (or the integers of a scalar)
+        if isinstance(other, QArray):
+            if len(other) != len(self):
+                raise ValueError('Both QArrays must have the same length')
+            c, d = other._n, other._d
+        elif isinstance(other, (int, Rational, Q)):
+            c, d = (other.numerator, other.denominator) if not isinstance(other, int) else (other, 1)
+        else:
+            return None
+        a, b = self._n, self._d
+        np = _numpy()
+        if np:
+            # int64 would overflow silently, so the big products are calculated with python integers
+            bound = max(self._max(a) * self._max(d) + self._max(c) * self._max(b), self._max(b) * self._max(d),
+                        self._max(a) * self._max(c))
+            if bound >= pow(2, 63):
+                a, b = a.astype(object), b.astype(object)
+                if isinstance(c, np.ndarray):
+                    c, d = c.astype(object), d.astype(object)
+        else:
+            a, b = list(a), list(b)
+            if not isinstance(c, int):
+                c, d = list(c), list(d)
+        return a, b, c, d
+
+    @staticmethod
+    def _max(x) -> int:
+        if isinstance(x, int):
+            return abs(x)
+        if len(x) == 0:
+            return 0
+        if hasattr(x, 'max'):
+            return max(abs(int(x.max())), abs(int(x.min())))
+        return max(abs(max(x)), abs(min(x)))
+
+    @staticmethod
+    def _apply(function, a, b, c, d):
+        # numpy calculates elementwise, the lists are calculated element by element
+        if _numpy() or isinstance(a, int):
+            return function(a, b, c, d)
+        if isinstance(c, int):
+            return [function(w, x, c, d) for w, x in zip(a, b)]
+        return [function(w, x, y, z) for w, x, y, z in zip(a, b, c, d)]
+
+    def _binary(self, other, numerator, denominator):
+        o = self._operands(other)
+        if o is None:
+            return NotImplemented
+        return QArray._new(self._apply(numerator, *o), self._apply(denominator, *o))
+
+    def __add__(self, other):
+        return self._binary(other, lambda a, b, c, d: a * d + c * b, lambda a, b, c, d: b * d)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self._binary(other, lambda a, b, c, d: a * d - c * b, lambda a, b, c, d: b * d)
+
+    def __rsub__(self, other):
+        return self._binary(other, lambda a, b, c, d: c * b - a * d, lambda a, b, c, d: b * d)
+
+    def __mul__(self, other):
+        return self._binary(other, lambda a, b, c, d: a * c, lambda a, b, c, d: b * d)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return self._binary(other, lambda a, b, c, d: a * d, lambda a, b, c, d: b * c)
+
+    def __rtruediv__(self, other):
+        return self._binary(other, lambda a, b, c, d: c * b, lambda a, b, c, d: d * a)
+
+    def __neg__(self):
+        return QArray._new(-self._n if _numpy() else [-i for i in self._n], self._d)
+
+    def __len__(self) -> int:
+        return len(self._n)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return QArray._new(self._n[i], self._d[i])
+        return Rational._new(int(self._n[i]), int(self._d[i]), True)
+
+    def __iter__(self):
+        for a, b in zip(self._n, self._d):
+            yield Rational._new(int(a), int(b), True)
+
+    def __repr__(self) -> str:
+        return 'QArray([' + ', '.join(str(i) for i in self) + '])'
+
+    def sum(self) -> Rational:
+        """
+        calculate the sum of all elements (reduced only once at the end)
+
+        :return: the sum
+        """
+        n = [int(i) for i in self._n]
+        d = [int(i) for i in self._d]
+        x = lcm_many(d)
+        return Rational(sum(a * (x // b) for a, b in zip(n, d)), x)
+
+    def product(self) -> Rational:
+        """
+        calculate the product of all elements (reduced only once at the end)
+
+        :return: the product
+        """
+        n = [int(i) for i in self._n]
+        d = [int(i) for i in self._d]
+        # multiply pairwise, so that the factors have similar sizes
+        while len(n) > 1:
+            n = [n[i] * n[i + 1] if i + 1 < len(n) else n[i] for i in range(0, len(n), 2)]
+            d = [d[i] * d[i + 1] if i + 1 < len(d) else d[i] for i in range(0, len(d), 2)]
+        if not n:
+            return Rational(1)
+        return Rational(n[0], d[0])
+
+    def to_floats(self) -> list:
+        """
+        :return: the elements as floats
+        """
+        return [int(a) / int(b) for a, b in zip(self._n, self._d)]
+
+    def to_rationals(self) -> list:
+        """
+        :return: the elements as Rationals
+        """
+        return list(self)
+
+    def to_q(self) -> list:
+        """
+        :return: the elements as Qs
+        """
+        return [Q(i) for i in self]
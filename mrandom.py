@@ -1,23 +1,245 @@
 
 
-def rand_bytes(number_of_bytes: int) -> bytes:
+class RandomPool:
     """
-    generate random bytes
+    A buffer of random bytes from the operating system (os.urandom), which is refilled in large chunks,
+    so that small requests don't need a system call each; thread-safe and reseeded after fork()
+    """
+
+    def __init__(self, chunk_size: int = 4096) -> None:
+        """
+        :param chunk_size: number of bytes which are requested from the operating system at once
+                           (bigger requests bypass the buffer)
+        """
+        from threading import Lock
+        from os import getpid, urandom
+        self.chunk_size = chunk_size
+        self._urandom = urandom
+        self._getpid = getpid
+        self._lock = Lock()
+        self._buffer = b''
+        self._position = 0
+        self._pid = getpid()
+        _RANDOM_POOLS.add(self)
+
+    def _reset(self) -> None:
+        # after fork() the child must not hand out the same bytes as the parent (and the lock may be held)
+        from threading import Lock
+        self._lock = Lock()
+        self._buffer = b''
+        self._position = 0
+        self._pid = self._getpid()
+
+    def read(self, number_of_bytes: int) -> bytes:
+        """
+        get random bytes
+
+        :param number_of_bytes: the number of bytes
+        :return: the bytes
+        """
+        if number_of_bytes >= self.chunk_size:
+            return self._urandom(number_of_bytes)
+        if not _FORK_HOOK and self._pid != self._getpid():
+            self._reset()
+        with self._lock:
+            i = self._position
+            j = i + number_of_bytes
+            if j > len(self._buffer):
+                self._buffer = self._urandom(self.chunk_size)
+                i = 0
+                j = number_of_bytes
+            self._position = j
+            return self._buffer[i:j]
+
+
+def _reset_random_pools() -> None:
+    for i in list(_RANDOM_POOLS):
+        i._reset()
+
+
+def _register_fork_hook() -> bool:
+    try:
+        from os import register_at_fork
+    except ImportError:
+        # there is no fork() (windows), RandomPool.read compares the process id instead
+        return False
+    register_at_fork(after_in_child=_reset_random_pools)
+    return True
+
+
+def _random_pools():
+    from weakref import WeakSet
+    return WeakSet()
+
+
+_RANDOM_POOLS = _random_pools()
+
+_FORK_HOOK = _register_fork_hook()
+
+_RANDOM_POOL = RandomPool()
+
+
+def set_random_pool(pool) -> None:
+    """
+    set the pool which rand_bytes (and therefore every function of mrandom) uses
+
+    :param pool: a RandomPool (for example with another chunk size), a DeterministicRandom (reproducible) or None
+                 (one os.urandom call per request)
+    """
+    global _RANDOM_POOL
+    _RANDOM_POOL = pool
+
+
+class DeterministicRandom:
+    """
+    A seedable generator of random bytes (SHAKE-256 in counter mode) for reproducible benchmarks and simulations;
+    NOT a replacement for the operating system in cryptography: anyone who knows the seed knows every byte.
+    It can be passed as rng= to every function of mrandom or used as a context manager:
+    'with DeterministicRandom(42): ...' makes it the generator of rand_bytes until the block ends.
+    A forked process repeats the same bytes, split() gives every worker its own stream.
+    """
+
+    block_size = 4096
+
+    def __init__(self, seed=None) -> None:
+        """
+        :param seed: an integer, bytes or a string (None: a random seed)
+        """
+        from threading import Lock
+        from hashlib import shake_256
+        if seed is None:
+            from os import urandom
+            seed = urandom(32)
+        if isinstance(seed, int):
+            seed = b'i' + seed.to_bytes(seed.bit_length() // 8 + 1, 'big', signed=True)
+        elif isinstance(seed, str):
+            seed = b's' + seed.encode()
+        else:
+            seed = b'b' + bytes(seed)
+        self._key = shake_256(b'mmL DeterministicRandom' + seed).digest(32)
+        self._lock = Lock()
+        self._buffer = b''
+        self._position = 0
+        self._counter = 0
+        self._previous = []
+
+    def _block(self, index: int) -> bytes:
+        from hashlib import shake_256
+        return shake_256(self._key + index.to_bytes(8, 'big')).digest(self.block_size)
+
+    def read(self, number_of_bytes: int) -> bytes:
+        """
+        get the next bytes of the stream
+
+        :param number_of_bytes: the number of bytes
+        :return: the bytes
+        """
+        with self._lock:
+            i = self._position
+            j = i + number_of_bytes
+            if j <= len(self._buffer):
+                self._position = j
+                return self._buffer[i:j]
+            parts = [self._buffer[i:]]
+            number_of_bytes -= len(parts[0])
+            while number_of_bytes > 0:
+                self._buffer = self._block(self._counter)
+                self._counter += 1
+                self._position = min(number_of_bytes, self.block_size)
+                parts.append(self._buffer[:self._position])
+                number_of_bytes -= self._position
+            return b''.join(parts)
+
+    def tell(self) -> int:
+        """
+        :return: the number of bytes which have been read (or skipped)
+        """
+        return self._counter * self.block_size - len(self._buffer) + self._position
+
+    def jump(self, number_of_bytes: int) -> 'DeterministicRandom':
+        """
+        skip bytes of the stream without generating them
+
+        :param number_of_bytes: the number of bytes
+        :return: the generator itself
+        """
+        with self._lock:
+            i = self.tell() + number_of_bytes
+            self._counter = i // self.block_size
+            self._buffer = self._block(self._counter)
+            self._counter += 1
+            self._position = i % self.block_size
+        return self
+
+    def split(self) -> 'DeterministicRandom':
+        """
+        create an independent generator (e.g. for a worker), which is seeded with the next 32 bytes of this one
+
+        :return: the new generator
+        """
+        return DeterministicRandom(self.read(32))
+
+    def __getstate__(self) -> dict:
+        return {'key': self._key, 'position': self.tell()}
+
+    def __setstate__(self, state: dict) -> None:
+        from threading import Lock
+        self._key = state['key']
+        self._lock = Lock()
+        self._buffer = b''
+        self._position = 0
+        self._counter = 0
+        self._previous = []
+        if state['position']:
+            self.jump(state['position'])
+
+    def __enter__(self) -> 'DeterministicRandom':
+        self._previous.append(_RANDOM_POOL)
+        set_random_pool(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        set_random_pool(self._previous.pop())
+
+
+def get_rng(rng=None):
+    """
+    get the generator which a function of mrandom uses
+
+    :param rng: the rng= argument of the function
+    :return: rng if it isn't None, otherwise the current default (a RandomPool, a DeterministicRandom or None for
+             one os.urandom call per request)
+    """
+    if rng is None:
+        return _RANDOM_POOL
+    return rng
+
+
+def rand_bytes(number_of_bytes: int, rng=None) -> bytes:
+    """
+    generate random bytes (cryptographically secure unless a DeterministicRandom is used)
 
     :param number_of_bytes: the number of bytes
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
     :return: the bytes
     """
-    from os import urandom
-    return urandom(number_of_bytes)
+    if rng is None:
+        rng = _RANDOM_POOL
+        if rng is None:
+            from os import urandom
+            return urandom(number_of_bytes)
+    return rng.read(number_of_bytes)
 
 
-def rand_fraction(accuracy: int = 16, include_one: bool = False, disable_gcd: bool = False) -> (int, int):
+def rand_fraction(accuracy: int = 16, include_one: bool = False, disable_gcd: bool = False,
+                  rng=None) -> (int, int):
     """
     generate a random fraction between 0 and 1
 
     :param accuracy: the 256th log of the denominator
     :param include_one: include the number one
     :param disable_gcd: reduce resource usage
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
     :return: a fraction (numerator, denominator)
     """
     if accuracy < 1:
@@ -26,7 +248,7 @@ def rand_fraction(accuracy: int = 16, include_one: bool = False, disable_gcd: bo
         from mmath import gcd, bytes_to_int
     except (ImportError, ModuleNotFoundError):
         from mmL.mmath import gcd, bytes_to_int
-    x = bytes_to_int(rand_bytes(accuracy))
+    x = bytes_to_int(rand_bytes(accuracy, rng))
     if include_one:
         y = pow(256, accuracy) - 1
     else:
@@ -38,23 +260,25 @@ def rand_fraction(accuracy: int = 16, include_one: bool = False, disable_gcd: bo
     return x, y
 
 
-def rand() -> float:
+def rand(rng=None) -> float:
     """
     generate a random number between 0 and 1
 
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
     :return: a float between 0 and 1 (not including 1)
     """
-    x, y = rand_fraction(disable_gcd=True)
+    x, y = rand_fraction(disable_gcd=True, rng=rng)
     return x / y
 
 
-def rand_below_fraction(a: int, b: int = 1, disable_gcd: bool = False) -> (int, int):
+def rand_below_fraction(a: int, b: int = 1, disable_gcd: bool = False, rng=None) -> (int, int):
     """
     generate a random fraction between 0 and the input
 
     :param a: numerator
     :param b: denominator
     :param disable_gcd: reduce resource usage
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
     :return: a random fraction between 0 and a/b
     """
     if b == 0:
@@ -69,7 +293,7 @@ def rand_below_fraction(a: int, b: int = 1, disable_gcd: bool = False) -> (int,
     while c > 1:
         c //= 256
         n += 1
-    x, y = rand_fraction(n, False, disable_gcd)
+    x, y = rand_fraction(n, False, disable_gcd, rng)
     x *= a
     y *= b
     if not disable_gcd:
@@ -79,81 +303,370 @@ def rand_below_fraction(a: int, b: int = 1, disable_gcd: bool = False) -> (int,
     return x, y
 
 
-def rand_below_int(n: int) -> int:
+def randbelow(n: int, rng=None) -> int:
+    """
+    generate a random integer below n (rejection sampling, unbiased)
+
+    :param n: any integer > 0
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
+    :return: a random integer x with 0 <= x < n
+    """
+    if n <= 0:
+        raise ValueError('n has to be positive')
+    if n <= 256:
+        # accept the bytes below the biggest multiple of n, so that x % n is uniform
+        limit = 256 - 256 % n
+        while True:
+            for x in rand_bytes(4, rng):
+                if x < limit:
+                    return x % n
+    if n <= 65536:
+        limit = 65536 - 65536 % n
+        while True:
+            x = int.from_bytes(rand_bytes(2, rng), 'big')
+            if x < limit:
+                return x % n
+    bits = (n - 1).bit_length()
+    size = (bits + 7) // 8
+    shift = size * 8 - bits
+    while True:
+        x = int.from_bytes(rand_bytes(size, rng), 'big') >> shift
+        if x < n:
+            return x
+
+
+def randrange(start: int, stop: int = None, step: int = 1, rng=None) -> int:
+    """
+    generate a random integer from range(start, stop, step) (like random.randrange)
+
+    :param start: lower limit (or the upper limit if stop is None)
+    :param stop: upper limit (NOT included)
+    :param step: the difference between two possible numbers
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
+    :return: a random integer of the range
+    """
+    if stop is None:
+        start, stop = 0, start
+    if step == 0:
+        raise ValueError('step may not be 0')
+    # len(range(...)) raises OverflowError above sys.maxsize
+    size = max(0, (stop - start + step - (1 if step > 0 else -1)) // step)
+    if size == 0:
+        raise ValueError('The range is empty')
+    return start + step * randbelow(size, rng)
+
+
+def rand_below_int(n: int, rng=None) -> int:
     """
     generate a random integer between 0 and the input
 
-    :param n: any integer
-    :return: a random number between 0 and n
+    :param n: any integer > 0
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
+    :return: a random number between 0 and n (NOT included)
     """
-    x, y = rand_below_fraction(n, 1, True)
-    return x // y
+    return randbelow(n, rng)
 
 
-def randint(a: int, b: int) -> int:
+def randint(a: int, b: int, rng=None) -> int:
     """
     generate a random integer between two integers
 
     :param a: lower limit
     :param b: upper limit (NOT included)
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
     :return: a random integer between a and b
     """
-    return rand_below_int(b - a) + a
+    if b <= a:
+        raise ValueError('The range is empty')
+    return randbelow(b - a, rng) + a
+
+
+def _free_slot(a: int, excluded, r: int, lo: int = 0, hi: int = None) -> int:
+    """
+    find the r-th integer (starting at a) which isn't in a sorted list
+
+    :param a: lower limit
+    :param excluded: sorted list of the exceptions (no duplicates)
+    :param r: index of the free slot
+    :param lo: index of the first exception which is at least a
+    :param hi: index after the last exception which is used (None: the end of the list)
+    :return: a + r + (number of exceptions below the result)
+    """
+    if hi is None:
+        hi = len(excluded)
+    # excluded[j] - a - (j - first) is the number of free slots below excluded[j] and never decreases
+    first = lo
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if excluded[mid] - a - (mid - first) <= r:
+            lo = mid + 1
+        else:
+            hi = mid
+    return a + r + lo - first
 
 
-def randint_except(a: int, b: int, e: list, max_guess: int = 65536) -> int:
+def randint_except(a: int, b: int, e, max_guess: int = 65536, rng=None) -> int:
     """
     generate a random integer between two integers which isn't included in a list
 
     :param a: lower limit
     :param b: upper limit (NOT included)
-    :param e: list of exceptions
-    :param max_guess: maximum number of guesses
+    :param e: exceptions: a set, or a sorted list or tuple without duplicates (used directly with bisect, neither
+              copied nor sorted); any other iterable is sorted first
+    :param max_guess: maximum number of guesses if only few integers are excluded
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
     :return: a random integer between a and b which isn't in e
     """
-    for j in range(max_guess):
-        x = randint(a, b - len(e))
-        for i in e:
-            if i <= x:
-                x += 1
-        if x < b and x not in e:
+    from bisect import bisect_left
+    n = b - a
+    if isinstance(e, (set, frozenset)):
+        if 2 * len(e) <= n:
+            # at least every second guess is free
+            for _ in range(max_guess):
+                x = a + randbelow(n, rng)
+                if x not in e:
+                    return x
+            raise InterruptedError('Maximum guesses reached')
+        e = sorted(i for i in e if a <= i < b)
+    elif not isinstance(e, (list, tuple)):
+        e = sorted(e)
+    lo = bisect_left(e, a)
+    hi = bisect_left(e, b, lo)
+    if hi - lo >= n:
+        raise ValueError('All integers are excluded')
+    if 2 * (hi - lo) <= n:
+        for _ in range(max_guess):
+            x = a + randbelow(n, rng)
+            i = bisect_left(e, x, lo, hi)
+            if i == hi or e[i] != x:
+                return x
+        raise InterruptedError('Maximum guesses reached')
+    return _free_slot(a, e, randbelow(n - (hi - lo), rng), lo, hi)
+
+
+class CodeAllocator:
+    """
+    Hands out unique random integers between two integers (e.g. game codes) until they are released again;
+    thread-safe and O(1) expected per code while at most half of the range is in use
+    """
+
+    def __init__(self, a: int, b: int, rng=None) -> None:
+        """
+        :param a: lower limit
+        :param b: upper limit (NOT included)
+        :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
+        """
+        from threading import Lock
+        if b <= a:
+            raise ValueError('The range is empty')
+        self.a = a
+        self.b = b
+        self.rng = rng
+        self._used = set()
+        self._sorted = []
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._used)
+
+    def __contains__(self, code: int) -> bool:
+        return code in self._used
+
+    def allocate(self) -> int:
+        """
+        reserve a random free integer
+
+        :return: the integer
+        """
+        with self._lock:
+            n = self.b - self.a
+            k = len(self._used)
+            if k >= n:
+                raise ValueError('All integers are in use')
+            if 2 * k <= n:
+                x = self.a + randbelow(n, self.rng)
+                while x in self._used:
+                    x = self.a + randbelow(n, self.rng)
+            else:
+                x = _free_slot(self.a, self._sorted, randbelow(n - k, self.rng))
+            self._add(x)
             return x
-    raise InterruptedError('Maximum guesses reached')
 
+    def reserve(self, code: int) -> bool:
+        """
+        mark an integer as used (e.g. codes loaded from a file)
+
+        :param code: the integer
+        :return: False if it was already in use
+        """
+        if not self.a <= code < self.b:
+            raise ValueError('The integer is out of range')
+        with self._lock:
+            if code in self._used:
+                return False
+            self._add(code)
+            return True
+
+    def release(self, code: int) -> None:
+        """
+        make an integer available again
+
+        :param code: the integer
+        """
+        from bisect import bisect_left
+        with self._lock:
+            if code in self._used:
+                self._used.remove(code)
+                del self._sorted[bisect_left(self._sorted, code)]
 
-def rand_bits(number_of_bits: int) -> str:
+    def _add(self, code: int) -> None:
+        from bisect import insort
+        self._used.add(code)
+        insort(self._sorted, code)
+
+
+def rand_bits(number_of_bits: int, rng=None) -> str:
     """
     generate a random sequence of bits
 
     :param number_of_bits: number of bits (length)
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
     :return: a random sequence of bits
     """
     try:
         from mmath import bytes_to_int
     except (ImportError, ModuleNotFoundError):
         from mmL.mmath import bytes_to_int
-    x = rand_bytes(number_of_bits // 8 + 1)
+    x = rand_bytes(number_of_bits // 8 + 1, rng)
     y = bytes_to_int(x)
     z = y % pow(2, number_of_bits)
     return format(z, '0' + str(number_of_bits) + 'b')
 
 
-def random_prime(bits: int, max_guesses: int = 65536) -> int:
+def _numpy_module():
+    try:
+        from mmath import _numpy
+    except (ImportError, ModuleNotFoundError):
+        from mmL.mmath import _numpy
+    np = _numpy()
+    if not np:
+        raise ImportError('numpy is not installed')
+    return np
+
+
+def randints(a: int, b: int, size: int, numpy: bool = False, rng=None):
+    """
+    generate many random integers between two integers at once (unbiased, from one big buffer of random bytes)
+
+    :param a: lower limit
+    :param b: upper limit (NOT included)
+    :param size: number of integers
+    :param numpy: return a numpy array (int64 or uint64) instead of an array.array ('q' or 'Q')
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
+    :return: the random integers
+    """
+    from array import array
+    if b <= a:
+        raise ValueError('The range is empty')
+    if -pow(2, 63) <= a and b <= pow(2, 63):
+        code = 'q'
+    elif 0 <= a and b <= pow(2, 64):
+        code = 'Q'
+    else:
+        raise OverflowError('The integers have to fit into 64 bits')
+    n = b - a
+    bits = max(1, (n - 1).bit_length())
+    width = 1 if bits <= 8 else 2 if bits <= 16 else 4 if bits <= 32 else 8
+    shift = 8 * width - bits
+    if numpy:
+        np = _numpy_module()
+        dtype = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}[width]
+        parts = []
+        missing = size
+        while missing > 0:
+            # draw a bit more than expected, so that one round is usually enough
+            count = missing * pow(2, bits) // n + missing // 16 + 16
+            x = np.frombuffer(rand_bytes(count * width, rng), dtype=dtype) >> dtype(shift)
+            if n != pow(2, bits):
+                x = x[x < dtype(n)]
+            parts.append(x[:missing])
+            missing -= len(parts[-1])
+        x = np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+        # the addition wraps around, which gives the correct result as a + x always fits
+        if code == 'q':
+            return x.astype(np.int64) + np.int64(a)
+        return x.astype(np.uint64) + np.uint64(a)
+    r = array(code)
+    unsigned = {1: 'B', 2: 'H', 4: 'I' if array('I').itemsize == 4 else 'L', 8: 'Q'}[width]
+    while len(r) < size:
+        missing = size - len(r)
+        count = missing * pow(2, bits) // n + missing // 16 + 16
+        x = array(unsigned, rand_bytes(count * width, rng))
+        r.extend([i + a for i in (j >> shift for j in x) if i < n][:missing])
+    return r
+
+
+def rands(size: int, numpy: bool = False, rng=None):
+    """
+    generate many random numbers between 0 and 1 at once (not including 1)
+
+    :param size: number of floats
+    :param numpy: return a numpy array instead of an array.array ('d')
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
+    :return: the random floats (53 random bits each)
+    """
+    from array import array
+    if numpy:
+        np = _numpy_module()
+        return (np.frombuffer(rand_bytes(size * 8, rng), dtype=np.uint64) >> np.uint64(11)) * (1.0 / pow(2, 53))
+    x = array('Q', rand_bytes(size * 8, rng))
+    return array('d', [(i >> 11) / 9007199254740992 for i in x])
+
+
+def rand_bits_array(n: int, numpy: bool = False, rng=None):
+    """
+    generate many random bits at once
+
+    :param n: the number of bits
+    :param numpy: return a numpy array (uint8) instead of an array.array ('B')
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
+    :return: the bits (0 or 1)
+    """
+    from array import array
+    data = rand_bytes((n + 7) // 8, rng)
+    if numpy:
+        np = _numpy_module()
+        return np.unpackbits(np.frombuffer(data, dtype=np.uint8))[:n]
+    if n == 0:
+        return array('B')
+    # the digits of the binary representation are turned into the bytes 0 and 1 (without a loop in python)
+    bits = format(int.from_bytes(data, 'big'), '0' + str(len(data) * 8) + 'b')[:n]
+    return array('B', bits.encode().translate(bytes.maketrans(b'01', b'\x00\x01')))
+
+
+def random_prime(bits: int, max_guesses: int = 65536, rng=None) -> int:
     """
     generate a random prime with a specified number of bits
 
     :param bits: number of bits (length)
     :param max_guesses: maximum number of guesses before an error occurs
+    :param rng: a DeterministicRandom (or any object with read(number_of_bytes)), None: the default generator
     :return: a random prime with a specified number of bits
     """
     if bits < 2:
         raise ValueError('There is no prime number')
     try:
-        from mmath import miller_prime
+        from mmath import miller_prime, bytes_to_int, prime_candidates
     except (ImportError, ModuleNotFoundError):
-        from mmL.mmath import miller_prime
-    for i in range(max_guesses):
-        x = int(rand_bits(bits), 2)
-        if miller_prime(x):
-            return x
+        from mmL.mmath import miller_prime, bytes_to_int, prime_candidates
+    guesses = 0
+    while guesses < max_guesses:
+        # random odd start with the highest bit set, then walk through the numbers which survive the sieve
+        x = bytes_to_int(rand_bytes(bits // 8 + 1, rng)) % pow(2, bits - 1) | pow(2, bits - 1) | 1
+        for i in prime_candidates(x):
+            if i >= pow(2, bits) or guesses >= max_guesses:
+                break
+            guesses += 1
+            if miller_prime(i):
+                return i
     raise InterruptedError('Maximum guesses reached')
@@ -35,24 +35,89 @@ def get_server_keys(server: str):
     return {'e': response['e'], 'n': response['n']}
 
 
-def _decode(cipher, d, n):
+_sessions = {}
+
+_servers_without_sessions = []
+
+_session_retries = {}
+
+_servers_with_binary_ciphers = []
+
+
+def _decode(cipher, d, n, server_e=None, server_n=None):
     try:
-        from mencryption import rsa_fernet_decrypt
+        from mencryption import rsa_fernet_decrypt, rsa_fernet_open, get_session_id, session_decrypt, rsa_fingerprint
     except ModuleNotFoundError:
-        from mmL.mencryption import rsa_fernet_decrypt
+        from mmL.mencryption import rsa_fernet_decrypt, rsa_fernet_open, get_session_id, session_decrypt, \
+            rsa_fingerprint
     from base64 import urlsafe_b64decode
-    return rsa_fernet_decrypt(urlsafe_b64decode(cipher), d, n).decode()
+    cipher = urlsafe_b64decode(cipher)
+    if cipher[0:1] == b'\x10':
+        session_id = get_session_id(cipher)
+        for i in _sessions.values():
+            if i['id'] == session_id:
+                return session_decrypt(cipher, i).decode()
+        raise EncryptionError()
+    if (server_e is None) or (server_n is None):
+        return rsa_fernet_decrypt(cipher, d, n).decode()
+    # version 1 ciphers carry the key of their sender, so the sender has to be compared with the server
+    keys = {rsa_fingerprint(server_e, server_n): (server_e, server_n)}
+    try:
+        data, valid, oe, on, _ = rsa_fernet_open(cipher, d, n, keys)
+    except Exception:
+        raise EncryptionError()
+    if not valid or oe != server_e or on != server_n:
+        raise EncryptionError()
+    return data.decode()
 
 
-def _send_request(data: str, e: int, d: int, n: int, server: str, server_e: int, server_n: int, action: str):
+def _get_session(e: int, d: int, n: int, server: str, server_e: int, server_n: int):
+    from json import loads
+    from time import time
+    if server in _servers_without_sessions or _session_retries.get(server, 0) > time():
+        return None
+    if (server, n) in _sessions and _sessions[(server, n)]['expires'] > time() + 60:
+        return _sessions[(server, n)]
+    try:
+        response = _send_request('session', e, d, n, server, server_e, server_n, '/session', False)
+        _sessions[(server, n)] = loads(_decode(response['_session'], d, n, server_e, server_n))
+        if 3 in response.get('versions', []) and server not in _servers_with_binary_ciphers:
+            _servers_with_binary_ciphers.append(server)
+    except RouteNotFound:
+        # the server doesn't support sessions
+        _servers_without_sessions.append(server)
+        return None
+    except NoAccount:
+        # sessions are only available after the account was created
+        return None
+    except MultiplayerError:
+        # probably a temporary problem, try again in a minute
+        _session_retries[server] = time() + 60
+        return None
+    return _sessions[(server, n)]
+
+
+def _send_request(data: str, e: int, d: int, n: int, server: str, server_e: int, server_n: int, action: str,
+                  use_session: bool = True):
     import requests
     try:
-        from mencryption import rsa_fernet_encrypt
+        from mencryption import rsa_fernet_encrypt, session_encrypt
     except ModuleNotFoundError:
-        from mmL.mencryption import rsa_fernet_encrypt
+        from mmL.mencryption import rsa_fernet_encrypt, session_encrypt
     from base64 import urlsafe_b64encode
+    session = None
+    if use_session:
+        session = _get_session(e, d, n, server, server_e, server_n)
     try:
-        encrypted = urlsafe_b64encode(rsa_fernet_encrypt(data.encode(), server_e, server_n, e, d, n)).decode()
+        if session is None and server in _servers_with_binary_ciphers:
+            # the server only needs the full key to create an account or a session
+            include_key = action in ['/create_account', '/session']
+            encrypted = urlsafe_b64encode(rsa_fernet_encrypt(data.encode(), server_e, server_n, e, d, n, 3,
+                                                             include_key)).decode()
+        elif session is None:
+            encrypted = urlsafe_b64encode(rsa_fernet_encrypt(data.encode(), server_e, server_n, e, d, n)).decode()
+        else:
+            encrypted = urlsafe_b64encode(session_encrypt(data.encode(), session)).decode()
     except Exception:
         raise EncryptionError()
 
@@ -63,6 +128,11 @@ def _send_request(data: str, e: int, d: int, n: int, server: str, server_e: int,
     except Exception:
         raise ConnectionIssue()
 
+    if session is not None and response.get('code') == 2:
+        # the server might have been restarted or the session has expired
+        del _sessions[(server, n)]
+        return _send_request(data, e, d, n, server, server_e, server_n, action, False)
+
     if 'error' in response:
         if 'code' in response:
             if response['code'] == 2:
@@ -105,12 +175,14 @@ def _send_request(data: str, e: int, d: int, n: int, server: str, server_e: int,
                 raise InvalidMessage()
             else:
                 raise MultiplayerError()
+        elif r.status_code in [404, 405]:
+            raise RouteNotFound()
         else:
             raise ConnectionIssue()
     elif r.status_code == 500:
         raise MultiplayerError()
     elif r.status_code in [404, 405]:
-        raise ConnectionIssue()
+        raise RouteNotFound()
     elif r.status_code != 200:
         raise ConnectionIssue()
     else:
@@ -204,7 +276,8 @@ class Host:
             banned_ids = []
 
         request = game + '\\' + str(max_players) + '\\' + str(banned_ids) + '\\' + str(int(public))
-        self.code = _decode(_send_request(request, e, d, n, server, server_e, server_n, '/init')['_code'], d, n)
+        self.code = _decode(_send_request(request, e, d, n, server, server_e, server_n, '/init')['_code'], d, n,
+                            server_e, server_n)
 
     def get_code(self) -> str:
         """
@@ -471,6 +544,11 @@ class ServerNotFound(ConnectionIssue):
     pass
 
 
+class RouteNotFound(ConnectionIssue):
+    """Raised if the server doesn't know the requested action (e.g. an older server)"""
+    pass
+
+
 class ServerNotOnList(ConnectionIssue):
     """Raised if the cryptographic keys are missing"""
     pass
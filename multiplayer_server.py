@@ -1,10 +1,11 @@
 from flask import Flask, request
-from mencryption import rsa_fernet_encrypt, rsa_fernet_decrypt, generate_rsa_keys, rsa_fernet_signature
+from mencryption import rsa_fernet_encrypt, rsa_fernet_open, generate_rsa_keys, RSAPrivateKey, generate_session, \
+    get_session_id, session_encrypt, session_decrypt, rsa_fingerprint
 from base64 import urlsafe_b64encode, urlsafe_b64decode
 from os.path import exists
-from json import dump, load
+from json import dump, load, dumps
 from time import time
-from mrandom import randint_except, rand_bytes
+from mrandom import CodeAllocator, rand_bytes
 from ast import literal_eval
 from mmath import bytes_to_int
 from logging import basicConfig as log_basicConfig, info as log_info, INFO as LOG_INFO
@@ -28,15 +29,19 @@ log_basicConfig(filename='multiplayer_server.log', format='%(asctime)s\t%(messag
 
 
 if not exists('rsa.json'):
-    _r = generate_rsa_keys(2048, None)
+    _r = generate_rsa_keys(2048, 65537)
     e, d, n = _r[0], _r[1], _r[2]
-    _x = {'e': e, 'd': d, 'n': n}
+    _x = {'e': e, **d.to_dict()}
     with open('rsa.json', 'w') as _f:
         dump(_x, _f, indent=4)
 else:
     with open('rsa.json', 'r') as _f:
         _x = load(_f)
     e, d, n = _x['e'], _x['d'], _x['n']
+    if 'p' in _x and 'q' in _x:
+        d = RSAPrivateKey.from_dict(_x)
+    else:
+        print('rsa.json does not contain p and q, private key operations will be slower')
 
 if not exists('accounts.json'):
     a = {}
@@ -48,6 +53,12 @@ else:
 
 g = {}
 
+game_codes = CodeAllocator(100000, 999999)
+
+sessions = {}
+
+fingerprints = {rsa_fingerprint(a[_i]['e'], a[_i]['n']): (a[_i]['e'], a[_i]['n']) for _i in a}
+
 
 def sha256(obj):
     h = sha3_256()
@@ -81,18 +92,30 @@ def get_account_name(rsa_n):
 
 
 def decode(cipher):
-    global d, n
-    return rsa_fernet_decrypt(urlsafe_b64decode(cipher), d, n).decode()
-
-
-def get_sender(cipher):
-    global d, n
-    signature = rsa_fernet_signature(urlsafe_b64decode(cipher), d, n)
-    return signature[1], signature[2]
+    global d, n, sessions, fingerprints
+    cipher = urlsafe_b64decode(cipher)
+    if cipher[0:1] == b'\x10':
+        s = sessions[get_session_id(cipher)]
+        return session_decrypt(cipher, s).decode(), s['e'], s['n'], s
+    data, valid, p_e, p_n, version = rsa_fernet_open(cipher, d, n, fingerprints)
+    if not valid:
+        raise ValueError('Signature is invalid')
+    return data.decode(), p_e, p_n, version
+
+
+def re(data, p_e, p_n, s=1):
+    # s is either a session or the version of the request
+    if isinstance(s, dict):
+        return urlsafe_b64encode(session_encrypt(data.encode(), s)).decode()
+    elif s == 3:
+        return urlsafe_b64encode(rsa_fernet_encrypt(data.encode(), p_e, p_n, e, d, n, 3, False)).decode()
+    return urlsafe_b64encode(rsa_fernet_encrypt(data.encode(), p_e, p_n, e, d, n)).decode()
 
 
-def re(data, p_e, p_n):
-    return urlsafe_b64encode(rsa_fernet_encrypt(data.encode(), p_e, p_n, e, d, n)).decode()
+def remove_expired_sessions():
+    global sessions
+    for i in [i for i in sessions if sessions[i]['expires'] < time()]:
+        del sessions[i]
 
 
 class MultiGame:
@@ -226,8 +249,7 @@ def handler_0():
 def handler_1(cipher):
     global a, _legal_characters, _illegal_names
     try:
-        data = decode(cipher)
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     if len(data) < 2:
@@ -244,17 +266,18 @@ def handler_1(cipher):
     if data in a.keys():
         return {'error': 'name is already in use', 'code': 104}, 400
     a[data] = {'e': p_e, 'n': p_n}
+    fingerprints[rsa_fingerprint(p_e, p_n)] = (p_e, p_n)
     with open('accounts.json', 'w') as f:
         dump(a, f, indent=4)
-    return {'success': 'Your account was created', 'e': p_e, 'n': p_n, 'name': re(data, p_e, p_n)}, 200
+    return {'success': 'Your account was created', 'e': p_e, 'n': p_n, 'name': re(data, p_e, p_n, s)}, 200
 
 
 @app.route('/api/game/init/<cipher>', methods=['GET'])
 def handler_2(cipher):
     # game\max_players\[banned_ids]\public[0/1]
     try:
-        data = decode(cipher).split('\\')
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
+        data = data.split('\\')
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     if get_account_name(p_n) is None:
@@ -281,17 +304,15 @@ def handler_2(cipher):
         public = True
     else:
         return {'error': 'public is neither 0 nor 1', 'code': 110}, 400
-    used_codes = [int(i) for i in g.keys()]
-    code = str(randint_except(100000, 999999, used_codes))
+    code = str(game_codes.allocate())
     g[code] = MultiGame(get_account_name(p_n), max_players, p_e, p_n, banned_ids, data[0], public)
-    return {'success': 'The game was created', '_code': re(code, p_e, p_n)}, 200
+    return {'success': 'The game was created', '_code': re(code, p_e, p_n, s)}, 200
 
 
 @app.route('/api/game/join/<cipher>', methods=['GET'])
 def handler_3(cipher):
     try:
-        data = decode(cipher)
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     name = get_account_name(p_n)
@@ -310,14 +331,13 @@ def handler_3(cipher):
     if g[data].is_full():
         return {'error': 'the game is full', 'code': 117}, 400
     g[data].join(p_e, p_n)
-    return {'success': 'you are now part of this game', '_code': re(data, p_e, p_n)}, 200
+    return {'success': 'you are now part of this game', '_code': re(data, p_e, p_n, s)}, 200
 
 
 @app.route('/api/game/disconnect/<cipher>', methods=['GET'])
 def handler_4(cipher):
     try:
-        data = decode(cipher)
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     name = get_account_name(p_n)
@@ -330,15 +350,15 @@ def handler_4(cipher):
     if not g[data].is_part(name):
         return {'error': 'you are not part of this game', 'code': 116}, 400
     g[data].leave(p_n)
-    return {'success': 'you left the game', 'host': g[data].is_host(name), '_code': re(data, p_e, p_n)}, 200
+    return {'success': 'you left the game', 'host': g[data].is_host(name), '_code': re(data, p_e, p_n, s)}, 200
 
 
 @app.route('/api/game/kick/<cipher>', methods=['GET'])
 def handler_5(cipher):
     # game\name\ban[0/1]\reason
     try:
-        data = decode(cipher).split('\\')
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
+        data = data.split('\\')
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     name = get_account_name(p_n)
@@ -366,15 +386,15 @@ def handler_5(cipher):
         g[data[0]].kick(data[1], data[3])
     else:
         return {'error': 'ban is neither 0 nor 1', 'code': 122}, 400
-    return {'success': 'the player got kicked', 'player': re(data[1], p_e, p_n)}, 200
+    return {'success': 'the player got kicked', 'player': re(data[1], p_e, p_n, s)}, 200
 
 
 @app.route('/api/game/status/<cipher>', methods=['GET'])
 def handler_6(cipher):
     # game\status[1/2/3]
     try:
-        data = decode(cipher).split('\\')
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
+        data = data.split('\\')
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     name = get_account_name(p_n)
@@ -397,15 +417,15 @@ def handler_6(cipher):
     if status < 1 or status > 3:
         return {'error': 'status is not supported', 'code': 124}, 400
     g[data[0]].set_status(status)
-    return {'success': 'the status was updated', 'status': re(data[1], p_e, p_n)}, 200
+    return {'success': 'the status was updated', 'status': re(data[1], p_e, p_n, s)}, 200
 
 
 @app.route('/api/game/message/<cipher>', methods=['GET'])
 def handler_7(cipher):
     # game\message
     try:
-        data = decode(cipher).split('\\')
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
+        data = data.split('\\')
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     name = get_account_name(p_n)
@@ -428,8 +448,7 @@ def handler_7(cipher):
 @app.route('/api/game/info/<cipher>', methods=['GET'])
 def handler_8(cipher):
     try:
-        data = decode(cipher)
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     name = get_account_name(p_n)
@@ -447,8 +466,7 @@ def handler_8(cipher):
 @app.route('/api/game/receive/<cipher>', methods=['GET'])
 def handler_9(cipher):
     try:
-        data = decode(cipher)
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     name = get_account_name(p_n)
@@ -466,8 +484,7 @@ def handler_9(cipher):
 @app.route('/api/game/public/<cipher>', methods=['GET'])
 def handler_10(cipher):
     try:
-        data = decode(cipher)
-        p_e, p_n = get_sender(cipher)
+        data, p_e, p_n, s = decode(cipher)
     except Exception:
         return {'error': 'could not decode your request', 'code': 2}, 400
     name = get_account_name(p_n)
@@ -483,6 +500,23 @@ def handler_10(cipher):
     return r
 
 
+@app.route('/api/game/session/<cipher>', methods=['GET'])
+def handler_12(cipher):
+    global sessions
+    try:
+        data, p_e, p_n, s = decode(cipher)
+    except Exception:
+        return {'error': 'could not decode your request', 'code': 2}, 400
+    if isinstance(s, dict):
+        return {'error': 'a session has to be requested with rsa', 'code': 3}, 400
+    if get_account_name(p_n) is None:
+        return {'error': 'you do not have an account', 'code': 10}, 400
+    remove_expired_sessions()
+    s = generate_session(3600)
+    sessions[s['id']] = {'e': p_e, 'n': p_n, **s}
+    return {'success': 'the session was created', '_session': re(dumps(s), p_e, p_n), 'versions': [1, 3]}, 200
+
+
 @app.route('/api/game/admin_info/<code>', methods=['GET'])
 def handler_11(code):
     if code != _admin_code: